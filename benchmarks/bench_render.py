@@ -0,0 +1,176 @@
+"""
+Render pipeline benchmark.
+
+Times every stage of turning a Challonge SVG into an image (bound scan,
+edit/serialization, rasterization and encoding at several scales) across formats and
+participant counts, records peak memory and saves the results to JSON.
+
+    python benchmarks/bench_render.py
+    python benchmarks/bench_render.py --sizes 64 256 --formats double_elimination --compare benchmarks/results/abc1234.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime, timezone
+from typing import Any
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from image_encoder import encode_image # noqa: E402
+from svg_editor import edit_svg, scan_bounds # noqa: E402
+from svg_generator import FORMATS, generate_svg # noqa: E402
+
+DEFAULT_SIZES: tuple[int, ...] = (8, 16, 32, 64, 128, 256, 512, 1024)
+DEFAULT_SCALES: tuple[float, ...] = (1, 2)
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def max_rss_kib() -> int:
+    """Peak resident set size of this process so far (KiB)"""
+    rss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def measure(func: Callable[[], Any], repeat: int) -> tuple[dict[str, float], Any]:
+    """Time a stage, then run it once more under tracemalloc for its peak Python allocations"""
+    timings: list[float] = []
+    result: Any = None
+
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "peak_alloc_kib": round(peak / 1024, 1),
+    }, result
+
+def load_rasterizer() -> Callable[..., bytes] | None:
+    try:
+        import cairosvg
+    except (ImportError, OSError) as e:
+        print(f"Skipping rasterization: cairosvg unavailable ({e})", file=sys.stderr)
+        return None
+    return cairosvg.svg2png
+
+def run(formats: list[str], sizes: list[int], scales: list[float], repeat: int) -> list[dict[str, Any]]:
+    svg2png = load_rasterizer()
+    results: list[dict[str, Any]] = []
+
+    for tournament_format in formats:
+        for participants in sizes:
+            svg: bytes = generate_svg(tournament_format, participants)
+            stages: dict[str, dict[str, float]] = {}
+
+            stages["scan_bounds"], _ = measure(lambda: scan_bounds(svg), repeat)
+            stages["edit_svg"], edited = measure(lambda: edit_svg(svg), repeat)
+
+            if svg2png:
+                for scale in scales:
+                    rss_before: int = max_rss_kib()
+                    stats, png = measure(lambda: svg2png(bytestring=edited, scale=scale), repeat)
+                    stats["png_bytes"] = len(png)
+                    stats["max_rss_growth_kib"] = max_rss_kib() - rss_before
+                    stages[f"rasterize_x{scale:g}"] = stats
+
+                    for image_format in ("png", "webp"):
+                        stats, encoded = measure(lambda: encode_image(png, image_format), repeat)
+                        stats["bytes"] = len(encoded)
+                        stages[f"encode_{image_format}_x{scale:g}"] = stats
+
+            row: dict[str, Any] = {
+                "format": tournament_format,
+                "participants": participants,
+                "svg_bytes": len(svg),
+                "stages": stages,
+            }
+            results.append(row)
+
+            summary: str = ", ".join(f"{name} {stats['mean_ms']:.1f}ms" for name, stats in stages.items())
+            print(f"{tournament_format:<20} {participants:>5}  {len(svg) / 1024:>8.1f} KiB  {summary}")
+
+    return results
+
+def compare(results: list[dict[str, Any]], baseline_path: str) -> None:
+    """Print mean time ratios against an earlier results file (>1 is slower)"""
+    with open(baseline_path, "r") as f:
+        baseline: dict[str, Any] = json.load(f)
+
+    previous: dict[tuple[str, int], dict[str, Any]] = {
+        (row["format"], row["participants"]): row["stages"] for row in baseline["results"]
+    }
+
+    print(f"\nCompared with {baseline['meta']['commit']} (current / baseline mean time):")
+    for row in results:
+        old_stages: dict[str, Any] | None = previous.get((row["format"], row["participants"]))
+        if not old_stages:
+            continue
+
+        ratios: list[str] = []
+        for name, stats in row["stages"].items():
+            if name in old_stages and old_stages[name]["mean_ms"] > 0:
+                ratio: float = stats["mean_ms"] / old_stages[name]["mean_ms"]
+                flag: str = " !" if ratio > 1.1 else ""
+                ratios.append(f"{name} {ratio:.2f}x{flag}")
+
+        print(f"{row['format']:<20} {row['participants']:>5}  " + ", ".join(ratios))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the bracket render pipeline")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument("--scales", nargs="+", type=float, default=list(DEFAULT_SCALES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    results: list[dict[str, Any]] = run(args.formats, args.sizes, args.scales, args.repeat)
+
+    commit: str = git_commit()
+    output: str = args.output or os.path.join(ROOT, "benchmarks", "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    with open(output, "w") as f:
+        json.dump({
+            "meta": {
+                "commit": commit,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "max_rss_kib": max_rss_kib(),
+            },
+            "results": results,
+        }, f, indent=2)
+
+    print(f"\nSaved results to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
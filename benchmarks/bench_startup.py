@@ -0,0 +1,109 @@
+"""
+Startup benchmark.
+
+Times, in fresh interpreter processes, what the bot does before it can connect to
+the gateway: importing `main`, building the bot (settings, state load, clients) and
+running its setup hook. Reports the median of several runs, lists any rendering
+module that was imported on the way and fails when the total is over the budget.
+The gateway connection itself is not included.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --tracked 2000 --state-backend sqlite --budget 1.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Any
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC: str = os.path.join(ROOT, "src")
+
+# Modules that belong in the render workers, not in the bot process at startup
+RENDER_MODULES: tuple[str, ...] = ("cairosvg", "cairocffi", "PIL.Image", "aiohttp.web")
+
+PROBE: str = """
+import time
+start = time.perf_counter()
+
+import asyncio, json, sys
+import main
+from settings import Settings
+imported = time.perf_counter()
+
+bot = main.DiscordBot(Settings(state_backend=sys.argv[1], metrics_port=0))
+built = time.perf_counter()
+
+async def setup():
+    await bot.setup_hook()
+    ready = time.perf_counter()
+    if bot._render_warmup:
+        bot._render_warmup.cancel()
+    await bot.scheduler.stop()
+    await bot.store.close()
+    return ready
+
+ready = asyncio.run(setup())
+print(json.dumps({
+    "import_s": imported - start,
+    "construct_s": built - imported,
+    "setup_s": ready - built,
+    "total_s": ready - start,
+    "loaded": [m for m in json.loads(sys.argv[2]) if m in sys.modules],
+}))
+"""
+
+async def seed_state(backend: str, tracked: int) -> None:
+    """Write a registry of `tracked` brackets for the probes to load"""
+    from state_store import init_store
+    from tournament_registry import TournamentRegistry
+
+    store = init_store(backend)
+    registry = TournamentRegistry(store)
+    for n in range(tracked):
+        registry.track(1, 1000 + n % 50, f"startup{n}")
+    await store.close()
+
+def probe(workdir: str, backend: str) -> dict[str, Any]:
+    env: dict[str, str] = {**os.environ, "PYTHONPATH": SRC}
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, backend, json.dumps(RENDER_MODULES)],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the bot startup before the gateway connects")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tracked", type=int, default=200, help="Brackets in the state loaded at startup")
+    parser.add_argument("--state-backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--budget", type=float, default=2, help="Seconds allowed for the median total")
+    args = parser.parse_args()
+
+    sys.path.insert(0, SRC)
+    workdir: str = tempfile.mkdtemp(prefix="challonge-startup-")
+    os.chdir(workdir)
+    asyncio.run(seed_state(args.state_backend, args.tracked))
+
+    runs: list[dict[str, Any]] = [probe(workdir, args.state_backend) for _ in range(args.runs)]
+
+    for stage in ("import_s", "construct_s", "setup_s", "total_s"):
+        samples: list[float] = [run[stage] for run in runs]
+        print(f"{stage[:-2]:<10} median {statistics.median(samples) * 1000:8.1f}ms  max {max(samples) * 1000:8.1f}ms")
+
+    loaded: set[str] = {module for run in runs for module in run["loaded"]}
+    if loaded:
+        print(f"Rendering modules imported at startup: {', '.join(sorted(loaded))}")
+
+    total: float = statistics.median(run["total_s"] for run in runs)
+    if total > args.budget:
+        print(f"Over budget: {total:.2f}s > {args.budget:.2f}s")
+        sys.exit(1)
+    print(f"Within budget: {total:.2f}s <= {args.budget:.2f}s")
+
+if __name__ == "__main__":
+    main()
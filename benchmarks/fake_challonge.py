@@ -0,0 +1,274 @@
+"""
+Local stand-in for challonge.com, for load tests that must not hit the real site.
+
+Serves the homepage (session cookie), the public tournament page with the
+embedded `"tournament": {"id": ...}` blob, `{slug}.svg` (with ETag support) and the
+v1 API (`tournaments.json` index and `tournaments/{id}.json`, matches included on request).
+Tournaments update at random at a configurable rate; latency and errors are injected.
+
+    python benchmarks/fake_challonge.py --tournaments 500 --update-seconds 120 --latency-ms 80 --error-rate 0.01
+
+Point a ChallongeClient at it with `base_url="http://localhost:8765/"` and
+`api_url="http://localhost:8765/v1/"` (a host name, the cookie jar ignores cookies set by IP addresses).
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+
+from aiohttp import web
+
+from svg_generator import FORMATS, generate_svg
+
+COOKIE_NAME = "_challonge_session"
+
+@dataclass
+class FakeServerConfig:
+    tournaments: int = 200
+    formats: tuple[str, ...] = FORMATS
+    sizes: tuple[int, ...] = (8, 16, 32, 64)
+    update_seconds: float = 300 # Mean time between updates of one tournament
+    complete_after: int = 0 # Updates before a tournament completes, 0 never completes
+    latency_ms: float = 50
+    jitter_ms: float = 25
+    error_rate: float = 0 # Share of requests answered with a 500
+    require_cookie: bool = True # 403 on pages and SVGs without the homepage cookie
+    seed: int = 0
+
+@dataclass
+class FakeTournament:
+    id: int
+    slug: str
+    tournament_format: str
+    participants: int
+    version: int = 0
+    updated_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    state: str = "underway"
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.id}-{self.version}"'
+
+def _api_matches(tournament: FakeTournament) -> dict[str, Any]:
+    """Participants and matches in the shape of the v1 API, as single elimination rounds"""
+    rng = random.Random(tournament.id * 1000 + tournament.version)
+    participants: list[dict[str, Any]] = [
+        {"participant": {"id": tournament.id * 10000 + seed, "name": f"Player {seed}", "seed": seed, "group_player_ids": []}}
+        for seed in range(1, tournament.participants + 1)
+    ]
+
+    matches: list[dict[str, Any]] = []
+    match_id: int = tournament.id * 10000
+    previous: list[int] = []
+    rounds: int = max(1, math.ceil(math.log2(tournament.participants)))
+
+    for round_number in range(1, rounds + 1):
+        current: list[int] = []
+        for m in range(max(1, 2 ** (rounds - round_number))):
+            match_id += 1
+            prereqs: list[int | None] = previous[m * 2:m * 2 + 2] or [None, None]
+            player1: int = rng.randint(1, tournament.participants) + tournament.id * 10000
+            player2: int = rng.randint(1, tournament.participants) + tournament.id * 10000
+            complete: bool = round_number <= tournament.version
+            matches.append({"match": {
+                "id": match_id,
+                "round": round_number,
+                "identifier": str(len(matches) + 1),
+                "player1_id": player1,
+                "player2_id": player2,
+                "player1_prereq_match_id": prereqs[0],
+                "player2_prereq_match_id": prereqs[1] if len(prereqs) > 1 else None,
+                "winner_id": player1 if complete else None,
+                "scores_csv": f"{rng.randint(2, 3)}-{rng.randint(0, 1)}" if complete else "",
+                "state": "complete" if complete else "open",
+                "group_id": None,
+                "suggested_play_order": len(matches) + 1,
+            }})
+            current.append(match_id)
+        previous = current
+
+    return {"participants": participants, "matches": matches}
+
+class FakeChallonge:
+    """The fake site and API over a set of simulated tournaments."""
+
+    def __init__(self, config: FakeServerConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.requests: int = 0
+        self.errors: int = 0
+        self._svgs: dict[tuple[int, int], bytes] = {}
+
+        self.tournaments: dict[int, FakeTournament] = {}
+        for n in range(config.tournaments):
+            tournament = FakeTournament(
+                id=1000 + n,
+                slug=f"soak{n}",
+                tournament_format=config.formats[n % len(config.formats)],
+                participants=config.sizes[n % len(config.sizes)],
+            )
+            self.tournaments[tournament.id] = tournament
+        self.by_slug: dict[str, FakeTournament] = {t.slug: t for t in self.tournaments.values()}
+
+    def slugs(self) -> list[str]:
+        return list(self.by_slug)
+
+    def tick(self, elapsed: float) -> None:
+        """Update each underway tournament with probability `elapsed / update_seconds`"""
+        chance: float = min(1, elapsed / self.config.update_seconds) if self.config.update_seconds else 0
+        for tournament in self.tournaments.values():
+            if tournament.state == "underway" and self.rng.random() < chance:
+                tournament.version += 1
+                tournament.updated_at = datetime.now(timezone.utc).isoformat()
+                if self.config.complete_after and tournament.version >= self.config.complete_after:
+                    tournament.state = "complete"
+
+    def svg(self, tournament: FakeTournament) -> bytes:
+        key: tuple[int, int] = (tournament.id, tournament.version)
+        if key not in self._svgs:
+            # Only the latest version of every tournament is kept
+            self._svgs = {k: v for k, v in self._svgs.items() if k[0] != tournament.id}
+            self._svgs[key] = generate_svg(tournament.tournament_format, tournament.participants, seed=tournament.version)
+        return self._svgs[key]
+
+    def api_tournament(self, tournament: FakeTournament, include_matches: bool) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "id": tournament.id,
+            "url": tournament.slug,
+            "subdomain": None,
+            "name": f"Soak {tournament.slug}",
+            "tournament_type": tournament.tournament_format.replace("_", " "),
+            "state": tournament.state,
+            "updated_at": tournament.updated_at,
+        }
+        if include_matches:
+            data.update(_api_matches(tournament))
+        return data
+
+    @web.middleware
+    async def faults(self, request: web.Request, handler: Any) -> web.StreamResponse:
+        """Latency and random 500s on every request"""
+        self.requests += 1
+        delay: float = max(0, self.rng.gauss(self.config.latency_ms, self.config.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+        if self.config.error_rate and self.rng.random() < self.config.error_rate:
+            self.errors += 1
+            raise web.HTTPInternalServerError()
+
+        return await handler(request)
+
+    def _check_cookie(self, request: web.Request) -> None:
+        if self.config.require_cookie and COOKIE_NAME not in request.cookies:
+            raise web.HTTPForbidden()
+
+    async def homepage(self, request: web.Request) -> web.Response:
+        response = web.Response(text="<html><body>Challonge</body></html>", content_type="text/html")
+        response.set_cookie(COOKIE_NAME, hashlib.md5(str(time.time()).encode()).hexdigest(), max_age=3600)
+        return response
+
+    async def page(self, request: web.Request) -> web.Response:
+        self._check_cookie(request)
+        name: str = request.match_info["name"]
+
+        if name.endswith(".svg"):
+            tournament: FakeTournament | None = self.by_slug.get(name[:-4])
+            if not tournament:
+                raise web.HTTPNotFound()
+            if request.headers.get("If-None-Match") == tournament.etag:
+                return web.Response(status=304, headers={"ETag": tournament.etag})
+            return web.Response(body=self.svg(tournament), content_type="image/svg+xml", headers={"ETag": tournament.etag})
+
+        tournament = self.by_slug.get(name)
+        if not tournament:
+            raise web.HTTPNotFound()
+
+        # The ID sits in a script blob after a long head, like the real page
+        padding: str = "<meta name=\"x\" content=\"" + "x" * 200 + "\">\n"
+        html: str = (
+            "<html><head>" + padding * 50 + "</head><body>"
+            f'<script>window._initialStoreState = {{"tournament": {{"id": {tournament.id}, "url": "{tournament.slug}"}}}};</script>'
+            "</body></html>"
+        )
+        return web.Response(text=html, content_type="text/html")
+
+    async def api_show(self, request: web.Request) -> web.Response:
+        key: str = request.match_info["id"]
+        tournament: FakeTournament | None = self.tournaments.get(int(key)) if key.isdigit() else self.by_slug.get(key)
+        if not tournament:
+            raise web.HTTPNotFound()
+
+        include_matches: bool = request.query.get("include_matches") == "1"
+        return web.json_response({"tournament": self.api_tournament(tournament, include_matches)})
+
+    async def api_index(self, request: web.Request) -> web.Response:
+        return web.json_response([{"tournament": self.api_tournament(t, False)} for t in self.tournaments.values()])
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.faults])
+        app.router.add_get("/", self.homepage)
+        app.router.add_get("/v1/tournaments.json", self.api_index)
+        app.router.add_get("/v1/tournaments/{id}.json", self.api_show)
+        app.router.add_get("/{name}", self.page)
+        return app
+
+async def serve(config: FakeServerConfig, host: str = "127.0.0.1", port: int = 8765, tick_seconds: float = 1) -> None:
+    """Run the fake server until cancelled"""
+    fake = FakeChallonge(config)
+    runner = web.AppRunner(fake.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Fake Challonge with {config.tournaments} tournaments on http://{host}:{port}/", flush=True)
+
+    try:
+        while True:
+            await asyncio.sleep(tick_seconds)
+            fake.tick(tick_seconds)
+    finally:
+        await runner.cleanup()
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--tournaments", type=int, default=200)
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[8, 16, 32, 64])
+    parser.add_argument("--update-seconds", type=float, default=300, help="Mean time between updates of one tournament")
+    parser.add_argument("--complete-after", type=int, default=0, help="Updates before a tournament completes (0: never)")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=25)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--no-cookie", action="store_true", help="Do not require the homepage cookie")
+    parser.add_argument("--seed", type=int, default=0)
+
+def config_from_arguments(args: argparse.Namespace) -> FakeServerConfig:
+    return FakeServerConfig(
+        tournaments=args.tournaments,
+        formats=tuple(args.formats),
+        sizes=tuple(args.sizes),
+        update_seconds=args.update_seconds,
+        complete_after=args.complete_after,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        require_cookie=not args.no_cookie,
+        seed=args.seed,
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a fake Challonge site and API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(config_from_arguments(args), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
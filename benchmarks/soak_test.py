@@ -0,0 +1,312 @@
+"""
+Soak test of the polling pipeline against the fake Challonge server.
+
+Drives every simulated tournament through `get_latest_bracket` on the poll
+scheduler, hands the images to a fake Discord sink and reports throughput,
+refresh latency percentiles and memory growth at a fixed interval.
+State and image cache files go to a scratch directory.
+
+    python benchmarks/soak_test.py --tournaments 500 --duration 7200 --poll-seconds 60
+    python benchmarks/soak_test.py --server http://127.0.0.1:8765/ --native
+    python benchmarks/soak_test.py --tournaments 2000 --shards 4
+
+With `--shards`, polling and rendering run in shard worker processes as with
+SHARD_WORKERS; latency percentiles then come from the forwarded refresh histogram,
+so they are bucket bounds.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp # noqa: E402
+
+from fake_challonge import FakeChallonge, add_config_arguments, config_from_arguments, serve # noqa: E402
+from bench_render import git_commit, max_rss_kib # noqa: E402
+
+def current_rss_kib() -> int:
+    """Resident set size right now, falling back to the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        return max_rss_kib()
+
+def _run_server(config: Any, port: int) -> None:
+    asyncio.run(serve(config, port=port))
+
+async def wait_for_server(url: str, timeout: float = 15) -> None:
+    deadline: float = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    return
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+class FakeDiscordSink:
+    """Stands in for the delivery queue: waits like an upload would and counts the bytes."""
+
+    def __init__(self, latency_ms: float = 150):
+        self.latency_ms = latency_ms
+        self.messages: int = 0
+        self.bytes: int = 0
+        self._next_id: int = 1
+
+    async def deliver(self, images: list[bytes]) -> int:
+        await asyncio.sleep(max(0, random.gauss(self.latency_ms, self.latency_ms / 4)) / 1000)
+        self.messages += 1
+        self.bytes += sum(len(image) for image in images)
+        self._next_id += 1
+        return self._next_id
+
+def histogram_percentiles(buckets: list[float], counts: list[int]) -> dict[str, float]:
+    """Percentiles (bucket upper bounds, in ms) of histogram counts"""
+    total: int = sum(counts)
+    result: dict[str, float] = {}
+    for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+        seen: int = 0
+        result[name] = 0
+        for bound, count in zip([*buckets, float("inf")], counts):
+            seen += count
+            if total and seen >= q * total:
+                result[name] = bound * 1000
+                break
+    return result
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if len(samples) < 2:
+        value: float = samples[0] if samples else 0
+        return {"p50_ms": value, "p95_ms": value, "p99_ms": value}
+
+    cuts: list[float] = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50_ms": round(cuts[49], 1), "p95_ms": round(cuts[94], 1), "p99_ms": round(cuts[98], 1)}
+
+async def soak(args: argparse.Namespace, base_url: str, slugs: list[str]) -> dict[str, Any]:
+    # Imported here so the forked fake server does not carry the bot modules
+    from bracket_drawer import get_latest_bracket
+    from challonge_client import ChallongeClient
+    from metrics import metrics
+    from poll_scheduler import PollOutcome, PollScheduler
+    from render_engine import RenderEngine
+    from settings import Settings
+    from shard_pool import ShardPool
+    from state_store import init_store
+    from status_poller import StatusPoller
+    from tournament_registry import TrackedTournament
+
+    store = init_store("json", flush_delay=1)
+    client = ChallongeClient(base_url=base_url, api_url=f"{base_url}v1/", api_key="soak")
+    engine = RenderEngine(workers=args.workers)
+    statuses: StatusPoller | None = StatusPoller(client, max_age=args.poll_seconds / 2) if args.status_index else None
+    sink = FakeDiscordSink(args.discord_latency_ms)
+
+    brackets: list[TrackedTournament] = [TrackedTournament(guild_id=1, channel_id=1, tournament_id=slug) for slug in slugs]
+    tracked: dict[str, TrackedTournament] = {bracket.key: bracket for bracket in brackets}
+
+    window: list[float] = []
+    all_samples: list[float] = []
+    outcomes: dict[str, int] = {outcome.name.lower(): 0 for outcome in PollOutcome}
+
+    shards: ShardPool | None = None
+
+    async def publish(bracket: TrackedTournament, update: Any) -> PollOutcome:
+        outcome: PollOutcome = PollOutcome.UNCHANGED
+        if update.images:
+            bracket.message_id = await sink.deliver(update.images)
+            update.commit(bracket)
+            outcome = PollOutcome.CHANGED
+        elif update.unchanged:
+            update.commit(bracket)
+        elif update.error:
+            outcome = PollOutcome.ERROR
+
+        if shards and outcome != PollOutcome.ERROR:
+            shards.sync(bracket)
+        outcomes[outcome.name.lower()] += 1
+        return outcome
+
+    async def refresh(key: str) -> PollOutcome:
+        bracket: TrackedTournament = tracked[key]
+        start: float = time.perf_counter()
+        update = await get_latest_bracket(client, engine, bracket, native=args.native, statuses=statuses)
+        outcome: PollOutcome = await publish(bracket, update)
+
+        elapsed: float = (time.perf_counter() - start) * 1000
+        window.append(elapsed)
+        all_samples.append(elapsed)
+        return outcome
+
+    async def publish_shard_update(key: str, update: Any) -> None:
+        await publish(tracked[key], update)
+
+    scheduler: PollScheduler | ShardPool
+    if args.shards:
+        # Fixed interval like the in-process scheduler below
+        minutes: float = args.poll_seconds / 60
+        settings = Settings(
+            challonge_api_key="soak",
+            challonge_url=base_url,
+            challonge_api_url=f"{base_url}v1/",
+            status_index_seconds=args.poll_seconds / 2 if args.status_index else 0,
+            poll_interval_minutes=minutes,
+            poll_min_minutes=minutes,
+            poll_max_minutes=minutes,
+            max_concurrent_polls=args.concurrency,
+            render_workers=args.workers,
+            bracket_renderer="native" if args.native else "svg",
+            shard_workers=args.shards
+        )
+        shards = scheduler = ShardPool(settings, lookup=tracked.get, on_update=publish_shard_update)
+    else:
+        scheduler = PollScheduler(
+            refresh,
+            interval=args.poll_seconds,
+            max_concurrency=args.concurrency,
+            backpressure=engine.wait_for_capacity
+        )
+        await engine.start()
+
+    for key in tracked:
+        scheduler.track(key)
+    scheduler.start()
+
+    def refresh_counts() -> list[int]:
+        histogram = metrics.stages.get("refresh")
+        return list(histogram.counts) if histogram else []
+
+    def latency(samples: list[float], since: list[int]) -> dict[str, float]:
+        """Refresh percentiles: raw samples in process, the forwarded histogram with shards"""
+        histogram = metrics.stages.get("refresh")
+        if not shards or not histogram:
+            return percentiles(samples)
+        before: list[int] = since or [0] * len(histogram.counts)
+        return histogram_percentiles(histogram.buckets, [now - then for now, then in zip(histogram.counts, before)])
+
+    window_counts: list[int] = []
+
+    reports: list[dict[str, Any]] = []
+    started: float = time.monotonic()
+    rss_start: int = current_rss_kib()
+    last_report: float = started
+    last_count: int = 0
+
+    try:
+        while time.monotonic() - started < args.duration:
+            await asyncio.sleep(min(args.report_seconds, args.duration - (time.monotonic() - started)))
+
+            now: float = time.monotonic()
+            count: int = sum(outcomes.values())
+            report: dict[str, Any] = {
+                "elapsed_s": round(now - started),
+                "refreshes_per_s": round((count - last_count) / (now - last_report), 2),
+                **latency(window, window_counts),
+                **outcomes,
+                "deliveries": sink.messages,
+                "rss_kib": current_rss_kib(),
+                "rss_growth_kib": current_rss_kib() - rss_start,
+                "render_queue": engine.queued,
+            }
+            reports.append(report)
+            print(
+                f"{report['elapsed_s']:>6}s  {report['refreshes_per_s']:>7.2f}/s  "
+                f"p50 {report['p50_ms']:>7.1f}ms  p95 {report['p95_ms']:>7.1f}ms  p99 {report['p99_ms']:>7.1f}ms  "
+                f"changed {outcomes['changed']}  errors {outcomes['error']}  rss +{report['rss_growth_kib']} KiB",
+                flush=True
+            )
+
+            window.clear()
+            window_counts = refresh_counts()
+            last_report, last_count = now, count
+    finally:
+        await scheduler.stop()
+        await client.close()
+        await engine.close()
+        await store.close()
+
+    return {
+        "summary": {
+            "duration_s": round(time.monotonic() - started),
+            "refreshes": sum(outcomes.values()),
+            **outcomes,
+            **latency(all_samples, []),
+            "deliveries": sink.messages,
+            "delivered_bytes": sink.bytes,
+            "rss_growth_kib": current_rss_kib() - rss_start,
+            "max_rss_kib": max_rss_kib(),
+            "counters": dict(metrics.counters),
+        },
+        "reports": reports,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Soak test the polling pipeline against a fake Challonge")
+    add_config_arguments(parser)
+    parser.add_argument("--server", help="Use a fake server already running at this base URL")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--duration", type=float, default=600, help="Seconds to run")
+    parser.add_argument("--report-seconds", type=float, default=30)
+    parser.add_argument("--poll-seconds", type=float, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None, help="Render workers (default: one per core, 0: thread)")
+    parser.add_argument("--native", action="store_true", help="Draw from API match data instead of the SVG")
+    parser.add_argument("--status-index", action="store_true", help="Read statuses from the batched tournament index")
+    parser.add_argument("--shards", type=int, default=0, help="Poll and render in this many shard worker processes")
+    parser.add_argument("--discord-latency-ms", type=float, default=150)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/soak-<commit>.json)")
+    args = parser.parse_args()
+
+    config = config_from_arguments(args)
+    slugs: list[str] = FakeChallonge(config).slugs()
+
+    server: multiprocessing.Process | None = None
+    # A host name, not an IP: the cookie jar ignores cookies set by IP addresses
+    base_url: str = args.server or f"http://localhost:{args.port}/"
+    if not args.server:
+        server = multiprocessing.Process(target=_run_server, args=(config, args.port), daemon=True)
+        server.start()
+
+    output: str = args.output or os.path.join(ROOT, "benchmarks", "results", f"soak-{git_commit()}.json")
+    os.chdir(tempfile.mkdtemp(prefix="challonge-soak-"))
+
+    try:
+        asyncio.run(wait_for_server(base_url))
+        results: dict[str, Any] = asyncio.run(soak(args, base_url, slugs))
+    except KeyboardInterrupt:
+        return
+    finally:
+        if server:
+            server.terminate()
+            server.join()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "arguments": vars(args),
+            },
+            **results,
+        }, f, indent=2)
+
+    print(f"\nSaved results to {output}")
+
+if __name__ == "__main__":
+    main()
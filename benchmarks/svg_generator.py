@@ -0,0 +1,188 @@
+"""
+Synthetic Challonge-style bracket SVGs for benchmarking.
+Layout follows the public `.svg` export: a header, round columns and match
+cards nested in `translate(...)` groups, with connector lines between rounds.
+"""
+import math
+import random
+from xml.sax.saxutils import escape
+
+FORMATS: tuple[str, ...] = ("single_elimination", "double_elimination", "round_robin", "swiss")
+
+HEADER_HEIGHT = 110
+CARD_WIDTH = 220
+CARD_HEIGHT = 55
+COLUMN_GAP = 40
+ROW_GAP = 20
+GROUP_GAP = 80
+
+def _player(rng: random.Random, seed: int) -> str:
+    return escape(f"Player {seed} {rng.choice(['Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo'])}")
+
+def _match_card(rng: random.Random, x: float, y: float, match_id: int, participants: int) -> str:
+    """One match card: frame, two player rows with seeds and scores"""
+    top: int = rng.randint(1, participants)
+    bottom: int = rng.randint(1, participants)
+    top_score, bottom_score = rng.randint(0, 3), rng.randint(0, 3)
+
+    return (
+        f'<g class="match -complete" data-match-id="{match_id}" transform="translate({x:g} {y:g})">'
+        f'<rect class="match--wrapper-background" width="{CARD_WIDTH}" height="{CARD_HEIGHT}" rx="3" fill="#f7f7f7" />'
+        f'<text class="match--identifier" x="-18" y="31" font-size="11">{match_id}</text>'
+        f'<g class="match--player" transform="translate(0 0)">'
+        f'<rect width="{CARD_WIDTH}" height="{CARD_HEIGHT / 2:g}" fill="#787a80" />'
+        f'<text class="match--seed" x="10" y="18" font-size="12">{top}</text>'
+        f'<text class="match--player-name" x="30" y="18" font-size="12">{_player(rng, top)}</text>'
+        f'<text class="match--player-score" x="{CARD_WIDTH - 15}" y="18" font-size="12">{top_score}</text>'
+        f'</g>'
+        f'<g class="match--player" transform="translate(0 {CARD_HEIGHT / 2:g})">'
+        f'<rect width="{CARD_WIDTH}" height="{CARD_HEIGHT / 2:g}" fill="#5b5d61" />'
+        f'<text class="match--seed" x="10" y="18" font-size="12">{bottom}</text>'
+        f'<text class="match--player-name" x="30" y="18" font-size="12">{_player(rng, bottom)}</text>'
+        f'<text class="match--player-score" x="{CARD_WIDTH - 15}" y="18" font-size="12">{bottom_score}</text>'
+        f'</g>'
+        f'</g>'
+    )
+
+def _connector(x1: float, y1: float, x2: float, y2: float) -> str:
+    mid: float = (x1 + x2) / 2
+    return f'<path d="M{x1:g} {y1:g} H{mid:g} V{y2:g} H{x2:g}" stroke="#999" fill="none" stroke-width="2" />'
+
+def _elimination_rounds(rng: random.Random, participants: int, rounds: int, y_offset: float, match_id: int, label: str) -> tuple[list[str], float, int]:
+    """Round columns of an elimination bracket, halving the matches every round"""
+    parts: list[str] = []
+    first_round: int = max(1, 2 ** rounds // 2)
+    slot: float = CARD_HEIGHT + ROW_GAP
+    previous: list[float] = []
+
+    for r in range(rounds):
+        matches: int = max(1, first_round // (2 ** r))
+        x: float = r * (CARD_WIDTH + COLUMN_GAP)
+        spacing: float = slot * (2 ** r)
+        centers: list[float] = []
+
+        parts.append(f'<g class="round" data-round="{label}{r + 1}" transform="translate(0 {y_offset:g})">')
+        for m in range(matches):
+            y: float = m * spacing + (spacing - CARD_HEIGHT) / 2
+            parts.append(_match_card(rng, x, y, match_id, participants))
+            centers.append(y + CARD_HEIGHT / 2)
+            match_id += 1
+
+        # Lines from the two feeding matches into this one
+        for m, center in enumerate(centers):
+            for feeder in previous[m * 2:m * 2 + 2]:
+                parts.append(_connector(x - COLUMN_GAP, feeder, x, center))
+        parts.append('</g>')
+        previous = centers
+
+    height: float = first_round * slot
+    return parts, height, match_id
+
+def _single_elimination(rng: random.Random, participants: int) -> tuple[list[str], float, float]:
+    rounds: int = max(1, math.ceil(math.log2(participants)))
+    parts, height, _ = _elimination_rounds(rng, participants, rounds, HEADER_HEIGHT, 1, "W")
+    return parts, rounds * (CARD_WIDTH + COLUMN_GAP), HEADER_HEIGHT + height
+
+def _double_elimination(rng: random.Random, participants: int) -> tuple[list[str], float, float]:
+    rounds: int = max(1, math.ceil(math.log2(participants)))
+    winners, winners_height, match_id = _elimination_rounds(rng, participants, rounds, HEADER_HEIGHT, 1, "W")
+
+    # Losers bracket: two columns per halving, placed under the winners bracket
+    losers_top: float = HEADER_HEIGHT + winners_height + GROUP_GAP
+    losers: list[str] = []
+    losers_rounds: int = max(1, 2 * (rounds - 1))
+    first_round: int = max(1, 2 ** rounds // 4)
+    slot: float = CARD_HEIGHT + ROW_GAP
+
+    for r in range(losers_rounds):
+        matches: int = max(1, first_round // (2 ** (r // 2)))
+        x: float = r * (CARD_WIDTH + COLUMN_GAP)
+        spacing: float = slot * (2 ** (r // 2))
+
+        losers.append(f'<g class="round" data-round="L{r + 1}" transform="translate(0 {losers_top:g})">')
+        for m in range(matches):
+            losers.append(_match_card(rng, x, m * spacing + (spacing - CARD_HEIGHT) / 2, match_id, participants))
+            match_id += 1
+        losers.append('</g>')
+
+    # Grand finals after the last winners round
+    finals_x: float = max(rounds, losers_rounds) * (CARD_WIDTH + COLUMN_GAP)
+    finals: str = (
+        f'<g class="round" data-round="GF" transform="translate(0 {HEADER_HEIGHT:g})">'
+        + _match_card(rng, finals_x, winners_height / 2, match_id, participants)
+        + '</g>'
+    )
+
+    height: float = losers_top + first_round * slot
+    return winners + losers + [finals], finals_x + CARD_WIDTH + COLUMN_GAP, height
+
+def _round_robin(rng: random.Random, participants: int) -> tuple[list[str], float, float]:
+    """Groups of up to 8 players, each group a block of round columns"""
+    parts: list[str] = []
+    group_size: int = min(8, participants)
+    groups: int = math.ceil(participants / group_size)
+    rounds: int = group_size - 1 if group_size % 2 == 0 else group_size
+    matches_per_round: int = group_size // 2
+    slot: float = CARD_HEIGHT + ROW_GAP
+    group_height: float = matches_per_round * slot + GROUP_GAP
+    match_id: int = 1
+
+    for g in range(groups):
+        top: float = HEADER_HEIGHT + g * group_height
+        parts.append(f'<g class="group" data-group="{g + 1}" transform="translate(0 {top:g})">')
+        parts.append(f'<text class="group--title" x="0" y="-10" font-size="16">Group {g + 1}</text>')
+        for r in range(rounds):
+            for m in range(matches_per_round):
+                parts.append(_match_card(rng, r * (CARD_WIDTH + COLUMN_GAP), m * slot, match_id, participants))
+                match_id += 1
+        parts.append('</g>')
+
+    return parts, rounds * (CARD_WIDTH + COLUMN_GAP), HEADER_HEIGHT + groups * group_height
+
+def _swiss(rng: random.Random, participants: int) -> tuple[list[str], float, float]:
+    """ceil(log2 n) rounds, every round pairs everyone"""
+    parts: list[str] = []
+    rounds: int = max(1, math.ceil(math.log2(participants)))
+    matches: int = max(1, participants // 2)
+    slot: float = CARD_HEIGHT + ROW_GAP
+    match_id: int = 1
+
+    for r in range(rounds):
+        parts.append(f'<g class="round" data-round="{r + 1}" transform="translate(0 {HEADER_HEIGHT:g})">')
+        for m in range(matches):
+            parts.append(_match_card(rng, r * (CARD_WIDTH + COLUMN_GAP), m * slot, match_id, participants))
+            match_id += 1
+        parts.append('</g>')
+
+    return parts, rounds * (CARD_WIDTH + COLUMN_GAP), HEADER_HEIGHT + matches * slot
+
+def generate_svg(tournament_format: str, participants: int, seed: int = 0) -> bytes:
+    """Build a Challonge-style bracket SVG for a format and participant count"""
+    rng = random.Random(seed)
+    builders = {
+        "single_elimination": _single_elimination,
+        "double_elimination": _double_elimination,
+        "round_robin": _round_robin,
+        "swiss": _swiss,
+    }
+    if tournament_format not in builders:
+        raise ValueError(f"Unknown format {tournament_format}, expected one of {FORMATS}")
+
+    body, width, height = builders[tournament_format](rng, participants)
+
+    # Challonge exports a fixed viewport, the bot resizes it to the content
+    header: str = (
+        f'<g class="tournament-header">'
+        f'<rect width="{width:g}" height="{HEADER_HEIGHT - 20}" fill="#ff7324" />'
+        f'<text x="20" y="50" font-size="28" fill="white">Benchmark {escape(tournament_format)} {participants}</text>'
+        f'</g>'
+    )
+    document: str = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'width="{min(width, 1200):g}" height="{min(height, 800):g}" class="bracket-svg">'
+        '<style>text { font-family: Helvetica, Arial, sans-serif; }</style>'
+        + header + "".join(body) +
+        '</svg>'
+    )
+    return document.encode()
@@ -1,64 +1,69 @@
 import asyncio
+import hashlib
 import os
 import re
-import xml.etree.ElementTree as ET
+from dataclasses import dataclass
 from typing import Any
 import logging
 
 import aiohttp
-import cairosvg
 from dotenv import load_dotenv
 
-from json_handler import load_json, save_json
+from challonge_client import ChallongeClient, ResponseTooLarge, read_capped, search_stream
+from metrics import metrics, span
+from native_renderer import BracketData, hash_bracket, parse_tournament
+from render_engine import RenderEngine
+from state_store import get_store
+from status_poller import StatusPoller
+from tournament_registry import TrackedTournament
 
 # Configure logging
 logger = logging.getLogger(f'{__name__}')
 
-# Load the api key from the .env file
-load_dotenv()
-CHALLONGE_API_KEY: str | None = os.getenv('CHALLONGE_API_KEY')
-
-# Get last_update
-user_data: dict[str, Any] = load_json()
-last_update: str | None = user_data.get("last_update")
-
-# Headers are crucial to avoid 403 Forbidden errors from Challonge
-HEADERS: dict[str, str] = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-    "Accept-Language": "en-US,en;q=0.9",
-    "Accept-Encoding": "gzip, deflate, br",
-    "Referer": "https://challonge.com/",
-    "Upgrade-Insecure-Requests": "1",
-    "Sec-Fetch-Dest": "document",
-    "Sec-Fetch-Mode": "navigate",
-    "Sec-Fetch-Site": "same-origin",
-    "Sec-Fetch-User": "?1",
-    "Connection": "keep-alive"
-}
-
-async def get_tournament_id(session: aiohttp.ClientSession, tournament_id: str) -> str | None:
+# The internal ID in the JavaScript of the public page
+TOURNAMENT_ID_PATTERN: re.Pattern[bytes] = re.compile(rb'"tournament":\s*\{\s*"id":\s*(\d+)')
+
+@dataclass
+class BracketUpdate:
+    """Outcome of one refresh, committed to the tracked bracket once it has been delivered."""
+    images: list[bytes] | None = None # One image, or one per tile for huge brackets
+    update_time: str | None = None
+    is_complete: bool = False
+    unchanged: bool = False # The bracket content matches the last render
+    error: bool = False # The status or the bracket could not be fetched
+    etag: str | None = None
+    last_modified: str | None = None
+    svg_hash: str | None = None # Hash of the SVG, or of the match data with the native renderer
+
+    def commit(self, tracked: TrackedTournament) -> None:
+        """Remember this update on the tracked bracket"""
+        tracked.last_update = self.update_time
+        tracked.etag = self.etag
+        tracked.last_modified = self.last_modified
+        tracked.svg_hash = self.svg_hash
+
+def hash_svg(content: bytes) -> str:
+    """Hash of the SVG with whitespace normalized, used to detect unchanged brackets"""
+    normalized: bytes = re.sub(rb"\s+", b" ", content).strip()
+    return hashlib.blake2b(normalized, digest_size=16).hexdigest()
+
+async def get_tournament_id(client: ChallongeClient, tournament_id: str) -> str | None:
     """Extracts the internal numeric ID from the public Challonge page."""
-    url: str = f"https://challonge.com/{tournament_id}"
+    url: str = f"{client.base_url}{tournament_id}"
     logger.info(f"Looking up ID from public page: {url}")
 
-    async with session.get("https://challonge.com/") as resp:
-        await resp.text()
-
     try:
-        async with session.get(url) as response:
+        async with client.get(url) as response:
             if response.status != 200:
                 logger.error(f"Failed to load page. Status: {response.status}")
                 return None
 
-            # Get HTML content
-            html: str = await response.text()
-            
-            # Find the ID hidden in the JavaScript
-            match = re.search(r'"tournament":\s*\{\s*"id":\s*(\d+)', html)
+            # Find the ID hidden in the JavaScript, without reading the rest of the page
+            # (the connection is then closed instead of drained)
+            match: re.Match[bytes] | None = await search_stream(response, TOURNAMENT_ID_PATTERN)
             
             if match:
-                found_id: str = match.group(1)
+                found_id: str = match.group(1).decode()
                 logger.info(f"Found Tournament ID: {found_id}")
                 return found_id
             else:
@@ -69,180 +74,243 @@ async def get_tournament_id(session: aiohttp.ClientSession, tournament_id: str)
         logger.error(f"Error looking up ID: {e}")
         return None
     
-async def fetch_challonge_bracket(session: aiohttp.ClientSession, tournament_id: str) -> bytes | None:
-    """Draw the challonge bracket"""
-    url: str = f"https://challonge.com/{tournament_id}.svg"
-
-    async with session.get("https://challonge.com/") as resp:
-        await resp.text()
+async def fetch_challonge_bracket(client: ChallongeClient, engine: RenderEngine, tournament_id: str, update: BracketUpdate | None = None) -> list[bytes] | None:
+    """
+    Draw the challonge bracket.
+    When an update is given, its validators and hash are sent/compared and
+    refreshed so unchanged brackets skip editing and rasterizing.
+    """
+    url: str = f"{client.base_url}{tournament_id}.svg"
 
     logger.info(f"Attempting to fetch: {url}")
 
+    # Conditional request headers
+    headers: dict[str, str] = {}
+    if update and update.etag:
+        headers["If-None-Match"] = update.etag
+    if update and update.last_modified:
+        headers["If-Modified-Since"] = update.last_modified
+
     try:
-        async with session.get(url) as response:
-            # Raise an exception for 4xx/5xx status codes
-            response.raise_for_status()
+        with span("svg_download", tournament_id):
+            async with client.get(url, headers=headers) as response:
+                if response.status == 304 and update:
+                    logger.info(f"SVG for {tournament_id} not modified")
+                    metrics.increment("svg_not_modified")
+                    update.unchanged = True
+                    return None
+
+                # Raise an exception for 4xx/5xx status codes
+                response.raise_for_status()
             
-            # Check content type to ensure it's likely an SVG
-            content_type: str = response.headers.get("Content-Type", "")
+                # Check content type to ensure it's likely an SVG
+                content_type: str = response.headers.get("Content-Type", "")
             
-            # Read the binary content
-            content: bytes = await response.read()
+                # Read the binary content, up to the size limit
+                content: bytes = await read_capped(response, client.max_body_bytes)
 
-            # Basic validation (check for SVG/XML signature)
-            if "image/svg+xml" in content_type or b"<svg" in content[:100].lower():
-                edited_content: bytes = await edit_svg(content)
+                svg_hash: str = hash_svg(content)
 
-                logger.info("Converting SVG to bytes via cairosvg")
+                if update:
+                    update.etag = response.headers.get("ETag")
+                    update.last_modified = response.headers.get("Last-Modified")
 
-                # Convert svg to bytes
-                image_bytes: bytes | None = await asyncio.to_thread(
-                    cairosvg.svg2png, 
-                    bytestring=edited_content,
-                    scale=2
-                )
+                    # Skip the render when the bracket itself did not change
+                    if svg_hash == update.svg_hash:
+                        logger.info(f"SVG content for {tournament_id} unchanged")
+                        metrics.increment("content_unchanged")
+                        update.unchanged = True
+                        return None
                 
-                logger.info(f"Image sucessfully convert to bytes")
-                return image_bytes
-            else:
-                logger.warning("The status was 200 OK, but the content does not look like an SVG")
-                logger.warning(f"Content-Type: {content_type}")
-                return None
+                    update.svg_hash = svg_hash
+
+                # Basic validation (check for SVG/XML signature)
+                if not ("image/svg+xml" in content_type or b"<svg" in content[:100].lower()):
+                    logger.warning("The status was 200 OK, but the content does not look like an SVG")
+                    logger.warning(f"Content-Type: {content_type}")
+                    return None
 
     except aiohttp.ClientResponseError as e:
         logger.error(f"HTTP Error: {e.status} - {e.message}")
         return None
+
+    except ResponseTooLarge as e:
+        logger.error(f"SVG for {tournament_id} skipped: {e}")
+        metrics.increment("svg_too_large")
+        return None
     
     except aiohttp.ClientError as e:
         logger.error(f"Connection Error: {e}")
         return None
+    
+    except asyncio.TimeoutError:
+        logger.error(f"Timed out fetching {url}")
+        return None
 
-async def fetch_last_update(session: aiohttp.ClientSession, tournament_id: str) -> tuple[str | None, bool]:
-    """Get last update time and status of tournament (completed or not)"""
-    # Find the hidden tournament id
-    hidden_id: str | None = await get_tournament_id(session, tournament_id)
+    # Render after the response is released so the connection goes back to the pool
+    logger.info("Editing and converting SVG to bytes in the render pool")
+
+    try:
+        images: list[bytes] = await engine.render_bracket(content, tournament_id=tournament_id, svg_hash=svg_hash)
+    except Exception as e:
+        logger.error(f"Failed to render {tournament_id}: {e!r}")
+        return None
+    
+    logger.info(f"Image sucessfully convert to bytes")
+    return images
+
+async def resolve_tournament_id(client: ChallongeClient, tournament_id: str, refresh: bool = False) -> str:
+    """Map a public slug to the internal ID, scraping the public page only on a cache miss"""
+    cached_id: str | None = get_store().get_item("tournament_ids", tournament_id)
+    if not refresh and cached_id:
+        return cached_id
+
+    with span("id_lookup", tournament_id):
+        hidden_id: str | None = await get_tournament_id(client, tournament_id)
     if not hidden_id:
-            hidden_id = tournament_id
+        return tournament_id
+
+    # The internal ID never changes, so keep it for good
+    get_store().set_item("tournament_ids", tournament_id, hidden_id)
+
+    return hidden_id
+
+async def fetch_tournament(client: ChallongeClient, tournament_id: str, include_matches: bool = False) -> dict[str, Any] | None:
+    """Get the tournament from the API, with its matches and participants when asked"""
+    # Find the hidden tournament id
+    hidden_id: str = await resolve_tournament_id(client, tournament_id)
     
-    url: str = f"https://api.challonge.com/v1/tournaments/{hidden_id}.json"
     PARAMS: dict[str, Any] = {
-        "api_key": CHALLONGE_API_KEY,
-        "include_matches": 0,
-        "include_participants": 0
+        "api_key": client.api_key,
+        "include_matches": int(include_matches),
+        "include_participants": int(include_matches)
     }
 
     try:
-        async with session.get(url, params=PARAMS) as response:
-            response.raise_for_status()
-            data: dict[str, Any] = await response.json()
-
-            tournament: dict[str, Any] = data['tournament']
-            last_update: str = tournament['updated_at']
-            state: str = tournament['state']
-            is_finished: bool = state in ("complete", "awaiting_review")
+        url: str = f"{client.api_url}tournaments/{hidden_id}.json"
+        async with client.get(url, warm=False, params=PARAMS) as response:
+            # A 404 on a cached ID means the lookup is stale, scrape it again
+            if response.status == 404 and get_store().get_item("tournament_ids", tournament_id):
+                logger.info(f"Cached ID {hidden_id} for {tournament_id} returned 404, looking it up again")
+                get_store().delete_item("tournament_ids", tournament_id)
+                hidden_id = await resolve_tournament_id(client, tournament_id, refresh=True)
+                url = f"{client.api_url}tournaments/{hidden_id}.json"
+
+                async with client.get(url, warm=False, params=PARAMS) as retry:
+                    retry.raise_for_status()
+                    data: dict[str, Any] = await retry.json()
+            else:
+                response.raise_for_status()
+                data = await response.json()
 
-            return last_update, is_finished
+        return data['tournament']
             
     except Exception as e:
         logger.error(f"Error Fetching Data: {e}")
+        return None
+
+def tournament_status(tournament: dict[str, Any] | None) -> tuple[str | None, bool]:
+    """Last update time and whether the tournament is finished"""
+    if not tournament:
         return None, False
 
-async def edit_svg(content: bytes, padding: int = 40) -> bytes:
-    """Convert svg from website into bytes"""
-    logger.info("Editing SVG file via XML")
+    last_update: str = tournament['updated_at']
+    state: str = tournament['state']
+    is_finished: bool = state in ("complete", "awaiting_review")
 
-    # Register namespaces to prevent 'ns0' prefixes in output
-    ET.register_namespace("", "http://www.w3.org/2000/svg")
-    ET.register_namespace("xlink", "http://www.w3.org/1999/xlink")
-    tree_root = ET.fromstring(content)
+    return last_update, is_finished
 
-    HEADER_OFFSET = 110 # Challonge header
-    MATCH_CARD_HEIGHT = 55 # Height of one bracket node
-    MATCH_CARD_WIDTH = 220 # Width of one bracket node
-    
-    max_x: float = 0
-    max_y: float = 0
-    is_found: bool = False
+async def fetch_last_update(client: ChallongeClient, tournament_id: str) -> tuple[str | None, bool]:
+    """Get last update time and status of tournament (completed or not)"""
+    return tournament_status(await fetch_tournament(client, tournament_id))
 
-    # Regex to pull coordinates from strings
-    translate_pattern = re.compile(r"translate\(\s*([\d.]+)[ ,]+([\d.]+)\s*\)")
+async def draw_native_bracket(engine: RenderEngine, tournament_id: str, tournament: dict[str, Any], update: BracketUpdate | None = None) -> list[bytes] | None:
+    """
+    Draw the bracket from the API matches and participants, without the public SVG.
+    When an update is given, its content hash is compared and refreshed like `fetch_challonge_bracket`.
+    """
+    bracket: BracketData = parse_tournament(tournament)
+    content_hash: str = hash_bracket(bracket)
 
-    for elem in tree_root.iter():
-        transform = elem.get('transform')
-        if transform:
-            match = translate_pattern.search(transform)
-            if match:
-                x = float(match.group(1))
-                y = float(match.group(2))
-                
-                if x > max_x: max_x = x
-                if y > max_y: max_y = y
-                is_found = True
-
-    # Calculate new dimensions based on findings
-    if is_found:
-        # Content Height = Header + Lowest Match Y + Match Height
-        content_height: float = HEADER_OFFSET + max_y + MATCH_CARD_HEIGHT
-        
-        # Content Width = Furthest Match X + Match Width
-        content_width: float = max_x + MATCH_CARD_WIDTH
-    else:
-        # Fallback if parsing fails
-        content_width = float(tree_root.get('width', 800))
-        content_height = float(tree_root.get('height', 600))
-
-    # Add padding
-    final_width: float = content_width + (padding * 2)
-    final_height: float = content_height + (padding * 1.5)
-
-    # Update root attributes
-    tree_root.set('width', str(final_width))
-    tree_root.set('height', str(final_height))
-    tree_root.set('viewBox', f"-{padding} -{padding} {final_width} {final_height}")
-
-    # Add white background
-    bg_rect = ET.Element('rect', {
-        'x': f"-{padding}",
-        'y': f"-{padding}",
-        'width': str(final_width),
-        'height': str(final_height),
-        'fill': 'white'
-    })
+    if update:
+        if content_hash == update.svg_hash:
+            logger.info(f"Match data for {tournament_id} unchanged")
+            metrics.increment("content_unchanged")
+            update.unchanged = True
+            return None
+
+        update.svg_hash = content_hash
+
+    try:
+        return await engine.render_native(bracket, tournament_id=tournament_id, content_hash=content_hash)
+    except Exception as e:
+        logger.error(f"Failed to draw {tournament_id}: {e!r}")
+        return None
+
+async def get_latest_bracket(
+    client: ChallongeClient,
+    engine: RenderEngine,
+    tracked: TrackedTournament,
+    native: bool = False,
+    statuses: StatusPoller | None = None
+) -> BracketUpdate:
+    """
+    Check for update, then update the bracket only when necessary.
+    With `native`, the status call also returns the matches and the bracket is drawn from them.
+    With `statuses`, the status comes from the shared tournament index when it lists the tournament.
+    """
+    tournament_id: str = tracked.tournament_id
+    tournament: dict[str, Any] | None = None
+
+    if statuses and not native:
+        tournament = await statuses.lookup(get_store().get_item("tournament_ids", tournament_id), tournament_id)
+
+    if tournament is None:
+        with span("status_fetch", tournament_id):
+            tournament = await fetch_tournament(client, tournament_id, include_matches=native)
+    update_time, is_complete = tournament_status(tournament)
+
+    update = BracketUpdate(update_time=update_time, is_complete=is_complete, error=update_time is None)
+
+    # Validators are only useful while there is a message showing the last render
+    if tracked.message_id:
+        update.etag = tracked.etag
+        update.last_modified = tracked.last_modified
+        update.svg_hash = tracked.svg_hash
+
+    # Without a status there is nothing to compare against, try again on the next poll
+    if update.error:
+        return update
+
+    if (tracked.last_update == update_time):
+        logger.info(f"No update needed for {tournament_id}")
+        metrics.increment("updates_skipped")
+        return update
     
-    # Insert at index 0 ensures it is in background
-    tree_root.insert(0, bg_rect)
-
-    return ET.tostring(tree_root)
-
-async def get_latest_bracket(tournament_id: str) -> tuple[bytes | None, bool]:
-    """Check for update, then update the bracket only when necessary"""
-    global last_update
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        update_time, is_complete = await fetch_last_update(session, tournament_id)
-
-        if (last_update == update_time):
-            logger.info(f"No update needed for {tournament_id}")
-            return None, is_complete
-        
-        logger.info(f"Update found for {tournament_id}")
-        
-        # Update last_update
-        last_update = update_time
-        user_data["last_update"] = update_time
-        save_json(user_data)
-
-        return await fetch_challonge_bracket(session, tournament_id), is_complete
+    logger.info(f"Update found for {tournament_id}")
+
+    if native and tournament:
+        update.images = await draw_native_bracket(engine, tournament_id, tournament, update)
+    else:
+        update.images = await fetch_challonge_bracket(client, engine, tournament_id, update)
+    update.error = update.images is None and not update.unchanged
+    return update
 
 async def main():
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
+    # Load the api key from the .env file
+    load_dotenv()
+
+    async with ChallongeClient(api_key=os.getenv('CHALLONGE_API_KEY')) as client:
         bracket_id = input("Enter Bracket ID: ").strip()
-        await fetch_challonge_bracket(session, bracket_id)
-        update_time, is_complete = await fetch_last_update(session, bracket_id)
+        await fetch_challonge_bracket(client, RenderEngine(workers=0), bracket_id)
+        update_time, is_complete = await fetch_last_update(client, bracket_id)
 
-        if last_update:
+        if update_time:
             print(f"Last Updated: {update_time}")
             print(f"Completed: {is_complete}")
 
+    await get_store().close()
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
@@ -0,0 +1,203 @@
+import asyncio
+import re
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+import logging
+
+import aiohttp
+from yarl import URL
+
+from settings import Settings
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+CHALLONGE_URL: str = "https://challonge.com/"
+CHALLONGE_API_URL: str = "https://api.challonge.com/v1/"
+
+# Bodies are read in chunks of this size
+READ_CHUNK_BYTES: int = 64 * 1024
+
+# Headers are crucial to avoid 403 Forbidden errors from Challonge
+HEADERS: dict[str, str] = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Referer": "https://challonge.com/",
+    "Upgrade-Insecure-Requests": "1",
+    "Sec-Fetch-Dest": "document",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Site": "same-origin",
+    "Sec-Fetch-User": "?1",
+    "Connection": "keep-alive"
+}
+
+class ResponseTooLarge(aiohttp.ClientError):
+    """A response body over the size limit."""
+
+async def read_capped(response: aiohttp.ClientResponse, limit: int | None) -> bytes:
+    """
+    Read a body chunk by chunk, giving up as soon as it grows past `limit` bytes
+    (or announces it will), so an oversized response is never held whole.
+    """
+    if limit and response.content_length and response.content_length > limit:
+        raise ResponseTooLarge(f"Body of {response.content_length} bytes is over the {limit} byte limit")
+
+    chunks: list[bytes] = []
+    size: int = 0
+    async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+        size += len(chunk)
+        if limit and size > limit:
+            raise ResponseTooLarge(f"Body is over the {limit} byte limit")
+        chunks.append(chunk)
+
+    # One copy at the end, the chunks are dropped right after
+    return b"".join(chunks)
+
+async def search_stream(response: aiohttp.ClientResponse, pattern: re.Pattern[bytes], overlap: int = 256) -> re.Match[bytes] | None:
+    """
+    Stream a body until `pattern` matches and stop reading there.
+    Only the current chunk and the last `overlap` bytes before it are kept,
+    so matches must be shorter than `overlap`.
+    """
+    window: bytes = b""
+    async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+        window = window[-overlap:] + chunk
+        match: re.Match[bytes] | None = pattern.search(window)
+
+        # A match touching the end of the window may continue in the next chunk
+        if match and match.end() < len(window):
+            return match
+
+    return pattern.search(window)
+
+class ChallongeClient:
+    """
+    Bot-wide HTTP client for Challonge.
+    Keeps one pooled `aiohttp.ClientSession` alive and warms the homepage
+    cookies once, refreshing them only when they expire or a 403 comes back.
+    The base URLs can point at a stand-in server for load tests.
+    `api_key` is sent with v1 API calls; without it only the public pages work.
+    `max_body_bytes` caps the SVG downloads read with `read_capped`.
+    """
+
+    def __init__(
+        self,
+        limit: int = 64,
+        limit_per_host: int = 16,
+        dns_ttl: int = 300,
+        keepalive_timeout: float = 60,
+        cookie_ttl: float = 60 * 60,
+        timeout: float = 30,
+        base_url: str = CHALLONGE_URL,
+        api_url: str = CHALLONGE_API_URL,
+        api_key: str | None = None,
+        max_body_bytes: int | None = 16 * 1024 * 1024
+    ):
+        self.api_key = api_key
+        self.max_body_bytes = max_body_bytes
+        self.base_url = base_url
+        self.api_url = api_url
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.cookie_ttl = cookie_ttl
+        self.timeout = timeout
+
+        self._session: aiohttp.ClientSession | None = None
+        self._warm_lock = asyncio.Lock()
+        self._warmed_at: float | None = None
+        self._had_cookies: bool = False
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session, created on first use inside the running loop"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                headers=HEADERS,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._warmed_at = None
+
+        return self._session
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "ChallongeClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    def _cookies_valid(self) -> bool:
+        """Check whether the warm-up cookies are still usable"""
+        if self._warmed_at is None:
+            return False
+
+        if time.monotonic() - self._warmed_at > self.cookie_ttl:
+            return False
+
+        # The cookie jar drops expired cookies on lookup
+        if self._had_cookies and not self.session.cookie_jar.filter_cookies(URL(self.base_url)):
+            return False
+
+        return True
+
+    async def warm_up(self, force: bool = False) -> None:
+        """Visit the homepage once to obtain the session cookies"""
+        async with self._warm_lock:
+            if not force and self._cookies_valid():
+                return
+
+            logger.info("Warming up Challonge session cookies")
+            try:
+                async with self.session.get(self.base_url) as resp:
+                    await resp.read() # Drain the body so the connection goes back to the pool
+            except aiohttp.ClientError as e:
+                logger.warning(f"Cookie warm-up failed: {e}")
+                return
+
+            self._warmed_at = time.monotonic()
+            self._had_cookies = bool(self.session.cookie_jar.filter_cookies(URL(self.base_url)))
+
+    @asynccontextmanager
+    async def get(self, url: str, warm: bool = True, **kwargs: Any) -> AsyncIterator[aiohttp.ClientResponse]:
+        """GET through the shared session, re-warming the cookies once on a 403"""
+        if warm:
+            await self.warm_up()
+
+        response: aiohttp.ClientResponse = await self.session.get(url, **kwargs)
+
+        if warm and response.status == 403:
+            logger.info(f"403 from {url}, refreshing cookies")
+            response.release()
+            await self.warm_up(force=True)
+            response = await self.session.get(url, **kwargs)
+
+        try:
+            yield response
+        finally:
+            response.release()
+
+def create_client(settings: Settings) -> ChallongeClient:
+    """The Challonge client configured by the bot settings"""
+    return ChallongeClient(
+        base_url=settings.challonge_url or CHALLONGE_URL,
+        api_url=settings.challonge_api_url or CHALLONGE_API_URL,
+        api_key=settings.challonge_api_key,
+        max_body_bytes=int(settings.svg_max_mb * 1024 * 1024) or None
+    )
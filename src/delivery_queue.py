@@ -0,0 +1,168 @@
+import asyncio
+import io
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+import logging
+
+import discord
+
+from metrics import metrics, span
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+@dataclass
+class Delivery:
+    """Images to post for one tracked bracket, editing its message when it has one."""
+    key: str
+    channel: discord.abc.Messageable
+    channel_id: int
+    message_id: int | None
+    content: str
+    images: list[tuple[str, bytes]] # Filename, data
+    tournament_id: str | None = None # For the metrics
+    on_delivered: list[Callable[[int], None]] = field(default_factory=list)
+
+class DeliveryQueue:
+    """
+    Posts rendered brackets to Discord without holding up the refreshes.
+
+    Every channel has its own worker sending one request at a time, so a channel
+    waiting on its rate limit bucket does not hold up the others, and sends are
+    spaced by `channel_interval` to stay under the bucket instead of hitting 429s.
+    A newer image for a bracket still waiting in the queue replaces the older one.
+    Messages are edited through cached `PartialMessage` handles, without fetching them first.
+    """
+
+    def __init__(self, max_concurrency: int = 8, channel_interval: float = 1, max_handles: int = 1024):
+        self.channel_interval = channel_interval
+        self.max_handles = max_handles
+
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._pending: dict[int, OrderedDict[str, Delivery]] = {}
+        self._workers: dict[int, asyncio.Task[None]] = {}
+        self._handles: OrderedDict[int, discord.PartialMessage] = OrderedDict()
+        self._message_ids: dict[str, int] = {} # Message posted by a delivery still followed by another
+
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._pending.values())
+
+    def submit(self, delivery: Delivery) -> None:
+        """Queue images for a bracket, replacing any not yet sent for the same bracket"""
+        queue: OrderedDict[str, Delivery] = self._pending.setdefault(delivery.channel_id, OrderedDict())
+
+        previous: Delivery | None = queue.get(delivery.key)
+        if previous:
+            logger.info(f"Replacing queued images for {delivery.key} with newer ones")
+            metrics.increment("deliveries_coalesced")
+            delivery.on_delivered = previous.on_delivered + delivery.on_delivered
+            delivery.message_id = delivery.message_id or previous.message_id
+
+        queue[delivery.key] = delivery
+
+        if delivery.channel_id not in self._workers:
+            self._workers[delivery.channel_id] = asyncio.create_task(self._drain(delivery.channel_id))
+
+    async def close(self, timeout: float = 10) -> None:
+        """Give the queued deliveries a chance to go out, then stop"""
+        workers: list[asyncio.Task[None]] = list(self._workers.values())
+        if not workers:
+            return
+
+        _, still_running = await asyncio.wait(workers, timeout=timeout)
+        for worker in still_running:
+            worker.cancel()
+
+        if still_running:
+            logger.warning(f"Dropped the deliveries of {len(still_running)} channel(s) on shutdown")
+
+    async def _drain(self, channel_id: int) -> None:
+        queue: OrderedDict[str, Delivery] = self._pending[channel_id]
+        last_sent: float = 0
+
+        try:
+            while queue:
+                wait: float = last_sent + self.channel_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                key, delivery = queue.popitem(last=False)
+
+                async with self._slots:
+                    message_id: int | None = await self._send(delivery)
+                last_sent = time.monotonic()
+
+                if message_id is None:
+                    continue
+
+                # A newer delivery queued meanwhile must edit this message, not post another
+                if key in queue:
+                    self._message_ids[key] = message_id
+                else:
+                    self._message_ids.pop(key, None)
+
+                for callback in delivery.on_delivered:
+                    try:
+                        callback(message_id)
+                    except Exception as e:
+                        logger.error(f"Delivery callback for {key} failed: {e!r}")
+        finally:
+            self._pending.pop(channel_id, None)
+            self._workers.pop(channel_id, None)
+
+    def _handle(self, channel: discord.abc.Messageable, message_id: int) -> discord.PartialMessage | None:
+        """Cached handle to edit a message without fetching it"""
+        handle: discord.PartialMessage | None = self._handles.get(message_id)
+        if handle:
+            self._handles.move_to_end(message_id)
+            return handle
+
+        get_partial_message = getattr(channel, "get_partial_message", None)
+        if get_partial_message is None:
+            return None
+
+        handle = get_partial_message(message_id)
+        self._handles[message_id] = handle
+        while len(self._handles) > self.max_handles:
+            self._handles.popitem(last=False)
+
+        return handle
+
+    async def _send(self, delivery: Delivery) -> int | None:
+        """Edit the bracket message, or post a new one when there is none. Returns the message ID."""
+        message_id: int | None = self._message_ids.get(delivery.key) or delivery.message_id
+        files: list[discord.File] = [discord.File(fp=io.BytesIO(data), filename=name) for name, data in delivery.images]
+
+        try:
+            if message_id:
+                message: discord.PartialMessage | discord.Message | None = self._handle(delivery.channel, message_id)
+
+                try:
+                    if message is None:
+                        with span("discord_fetch", delivery.tournament_id):
+                            message = await delivery.channel.fetch_message(message_id)
+
+                    with span("discord_edit", delivery.tournament_id):
+                        await message.edit(content=delivery.content, attachments=files) # Edit existing message with the new images
+                    return message_id
+
+                except discord.NotFound:
+                    # Message was deleted, send new message
+                    self._handles.pop(message_id, None)
+                    files = [discord.File(fp=io.BytesIO(data), filename=name) for name, data in delivery.images]
+
+            with span("discord_send", delivery.tournament_id):
+                new_message: discord.Message = await delivery.channel.send(content=delivery.content, files=files)
+            return new_message.id
+
+        except discord.HTTPException as e:
+            logger.error(f"Failed to deliver {delivery.key}: {e}")
+            metrics.increment("deliveries_failed")
+            return None
+
+        finally:
+            for file in files:
+                file.close()
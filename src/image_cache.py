@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import os
+import struct
+from collections import OrderedDict
+from typing import Any
+import logging
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+# Cache files hold the images of one render: a count, then length-prefixed images
+FRAME = struct.Struct(">I")
+
+def make_cache_key(tournament_id: str, svg_hash: str, *params: Any) -> str:
+    """Cache key of one render: same bracket content and render parameters (scale, padding...) give the same images"""
+    return ":".join([tournament_id, svg_hash] + [str(param) for param in params])
+
+def pack_images(images: list[bytes]) -> bytes:
+    return b"".join([FRAME.pack(len(images))] + [FRAME.pack(len(image)) + image for image in images])
+
+def unpack_images(data: bytes) -> list[bytes]:
+    (count,) = FRAME.unpack_from(data, 0)
+    offset: int = FRAME.size
+    images: list[bytes] = []
+
+    for _ in range(count):
+        (size,) = FRAME.unpack_from(data, offset)
+        offset += FRAME.size
+        images.append(data[offset:offset + size])
+        offset += size
+
+    return images
+
+class ImageCache:
+    """
+    Two-tier LRU cache of rendered bracket images (one or more tiles per render).
+    Entries live in memory first; when the memory tier is over its byte limit
+    the least recently used entries are moved to a size-capped disk tier.
+    """
+
+    def __init__(self, memory_bytes: int = 64 * 1024 * 1024, disk_bytes: int = 512 * 1024 * 1024, directory: str = "cache/images"):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+
+        self._memory: OrderedDict[str, list[bytes]] = OrderedDict()
+        self._memory_size: int = 0
+        self._disk: OrderedDict[str, int] = OrderedDict() # file name -> size, oldest first
+        self._disk_size: int = 0
+        self._lock = asyncio.Lock()
+
+        self._load_disk_index()
+
+    def _load_disk_index(self) -> None:
+        """Rebuild the disk LRU order from file modification times"""
+        if self.disk_bytes <= 0:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        entries: list[tuple[float, str, int]] = []
+        for name in os.listdir(self.directory):
+            path: str = os.path.join(self.directory, name)
+            if name.endswith(".img") and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_size += size
+
+        logger.info(f"Image cache: {len(self._disk)} file(s), {self._disk_size} bytes on disk")
+
+    @staticmethod
+    def _file_name(key: str) -> str:
+        return hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + ".img"
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    async def get(self, key: str) -> list[bytes] | None:
+        """Look up the images of a render, moving disk hits back into memory"""
+        images: list[bytes] | None = self._memory.get(key)
+        if images is not None:
+            self._memory.move_to_end(key)
+            return images
+
+        name: str = self._file_name(key)
+        if name not in self._disk:
+            return None
+
+        async with self._lock:
+            # A concurrent put may have evicted the file or spilled a fresher copy while we waited
+            images = self._memory.get(key)
+            if images is not None:
+                self._memory.move_to_end(key)
+                return images
+            if name not in self._disk:
+                return None
+
+            try:
+                data: bytes = await asyncio.to_thread(self._read_file, self._path(name))
+                images = unpack_images(data)
+            except (OSError, struct.error) as e:
+                logger.warning(f"Dropping unreadable cache file {name}: {e}")
+                self._forget_disk(name)
+                return None
+
+            # The entry moves to memory rather than living in both tiers, it is spilled again on eviction
+            self._forget_disk(name)
+            await asyncio.to_thread(self._remove_file, self._path(name))
+            await self._store(key, images)
+            return images
+
+    async def put(self, key: str, images: list[bytes]) -> None:
+        """Store the images of a render in memory, spilling least recently used entries to disk"""
+        async with self._lock:
+            await self._store(key, images)
+
+    async def _store(self, key: str, images: list[bytes]) -> None:
+        if key in self._memory:
+            self._memory_size -= sum(map(len, self._memory.pop(key)))
+
+        self._memory[key] = images
+        self._memory_size += sum(map(len, images))
+
+        while self._memory_size > self.memory_bytes and self._memory:
+            old_key, old_images = self._memory.popitem(last=False)
+            self._memory_size -= sum(map(len, old_images))
+            await self._spill(old_key, old_images)
+
+    async def flush(self) -> None:
+        """Write every memory entry to disk so a restart can be served from the cache"""
+        async with self._lock:
+            for key, images in list(self._memory.items()):
+                await self._spill(key, images)
+
+    async def _spill(self, key: str, images: list[bytes]) -> None:
+        """Move an evicted memory entry into the disk tier"""
+        data: bytes = pack_images(images)
+        if len(data) > self.disk_bytes:
+            return
+
+        name: str = self._file_name(key)
+        if name in self._disk:
+            self._disk.move_to_end(name)
+            return
+
+        try:
+            await asyncio.to_thread(self._write_file, self._path(name), data)
+        except OSError as e:
+            logger.warning(f"Failed to write cache file {name}: {e}")
+            return
+
+        self._disk[name] = len(data)
+        self._disk_size += len(data)
+
+        while self._disk_size > self.disk_bytes and self._disk:
+            old_name = next(iter(self._disk))
+            self._forget_disk(old_name)
+            await asyncio.to_thread(self._remove_file, self._path(old_name))
+
+    def _forget_disk(self, name: str) -> None:
+        self._disk_size -= self._disk.pop(name, 0)
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _write_file(path: str, data: bytes) -> None:
+        temp_path: str = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,80 @@
+import io
+import math
+from typing import TYPE_CHECKING
+import logging
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+IMAGE_FORMATS: tuple[str, ...] = ("png", "webp")
+
+def pick_scale(width: float, height: float, min_scale: float = 1, max_scale: float = 2, target_pixels: int = 8 * 1024 * 1024) -> float:
+    """Largest scale (within bounds) that keeps the raster around `target_pixels`"""
+    if width <= 0 or height <= 0:
+        return max_scale
+
+    scale: float = math.sqrt(target_pixels / (width * height))
+    return round(max(min_scale, min(max_scale, scale)), 2)
+
+def _save(image: "Image.Image", image_format: str, quality: int) -> bytes:
+    with io.BytesIO() as buffer:
+        if image_format == "webp":
+            # Lossless keeps text crisp; lossy is only used to reach the byte budget
+            if quality >= 100:
+                image.save(buffer, format="WEBP", lossless=True, method=6)
+            else:
+                image.save(buffer, format="WEBP", quality=quality, method=6)
+        else:
+            image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue()
+
+def encode_image(png: bytes, image_format: str = "png", colors: int = 128, max_bytes: int | None = None) -> bytes:
+    """
+    Re-encode a rendered PNG for upload.
+    Brackets are flat colours and text, so a small palette shrinks them a lot.
+    When `max_bytes` is given, fewer colours (unless `colors` is 0), lossy WebP
+    and finally downscaling are tried until the image fits.
+    """
+    # Pillow is only imported where pixels are touched, in the render workers
+    from PIL import Image
+
+    with Image.open(io.BytesIO(png)) as source:
+        # The background rect is white, so alpha is not needed
+        image: Image.Image = source.convert("RGB")
+
+    def quantize(img: Image.Image, palette_size: int) -> Image.Image:
+        if not palette_size:
+            return img
+        return img.quantize(colors=palette_size, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+
+    encoded: bytes = _save(quantize(image, colors), image_format, 100)
+    if not max_bytes or len(encoded) <= max_bytes:
+        return encoded
+
+    # Fewer colours first, unless full colour was asked for
+    palette_size: int = colors
+    quality: int = 100
+    while colors and len(encoded) > max_bytes and palette_size > 16:
+        palette_size //= 2
+        encoded = _save(quantize(image, palette_size), image_format, 100)
+
+    # Then lossy WebP, on the full colour image
+    if image_format == "webp":
+        for lossy_quality in (90, 75, 60):
+            if len(encoded) <= max_bytes:
+                break
+            palette_size, quality = 0, lossy_quality
+            encoded = _save(image, image_format, quality)
+
+    # Last resort: shrink the image, keeping the palette or quality reached above
+    while len(encoded) > max_bytes and min(image.size) > 256:
+        image = image.resize((int(image.width * 0.75), int(image.height * 0.75)), Image.Resampling.LANCZOS)
+        encoded = _save(quantize(image, palette_size), image_format, quality)
+
+    if len(encoded) > max_bytes:
+        logger.warning(f"Image is still {len(encoded)} bytes, over the {max_bytes} byte budget")
+
+    return encoded
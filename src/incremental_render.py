@@ -0,0 +1,220 @@
+import hashlib
+import io
+import math
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+import logging
+
+from svg_editor import MATCH_CARD_HEIGHT, MATCH_CARD_WIDTH, ROOT_TAG_PATTERN, root_attributes, set_root_viewport
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+# Room around a card for what is drawn just outside it (match identifier, connector ends)
+CARD_MARGIN = 24
+
+# Above this share of the image, repainting regions costs more than a full render
+MAX_DIRTY_RATIO = 0.5
+
+G_TAG_PATTERN = re.compile(rb"<(/?)g\b([^>]*?)(/?)>")
+CLASS_PATTERN = re.compile(rb"""\bclass\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+MATCH_ID_PATTERN = re.compile(rb"""\bdata-match-id\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+TRANSFORM_PATTERN = re.compile(rb"""\btransform\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+TRANSLATE_ONLY_PATTERN = re.compile(rb"^\s*translate\(\s*(-?[\d.]+)(?:[ ,]+(-?[\d.]+))?\s*\)\s*$")
+
+Box = tuple[float, float, float, float] # x, y, width, height
+
+@dataclass(frozen=True)
+class Card:
+    """One match card: its byte span in the document, absolute position and content hash."""
+    start: int
+    end: int
+    x: float
+    y: float
+    digest: str
+
+    @property
+    def box(self) -> Box:
+        return (self.x - CARD_MARGIN, self.y - CARD_MARGIN, MATCH_CARD_WIDTH + CARD_MARGIN * 2, MATCH_CARD_HEIGHT + CARD_MARGIN * 2)
+
+@dataclass
+class CardIndex:
+    """Match cards of an edited SVG and a hash of everything else."""
+    cards: dict[str, Card] = field(default_factory=dict)
+    skeleton_hash: str = ""
+
+@dataclass
+class BaseRender:
+    """Last full-quality raster of a bracket, kept to repaint only what changed."""
+    png: bytes
+    index: CardIndex
+    view_box: Box
+    scale: float
+
+def _attr(pattern: re.Pattern[bytes], tag: bytes) -> bytes | None:
+    match = pattern.search(tag)
+    if not match:
+        return None
+    return match.group(1) if match.group(1) is not None else match.group(2)
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def index_cards(edited: bytes) -> CardIndex | None:
+    """
+    Walk the <g> tags once, tracking the translate offsets of the enclosing groups,
+    and record every `match` group. Returns None when the layout cannot be diffed
+    (a group uses a transform other than translate, or no cards are found).
+    """
+    offsets: list[tuple[float, float]] = [(0.0, 0.0)]
+    card_starts: list[tuple[int, int, str, float, float]] = [] # depth, start, key, x, y
+    cards: dict[str, Card] = {}
+    spans: list[tuple[int, int]] = []
+    ordinal: int = 0
+
+    for tag in G_TAG_PATTERN.finditer(edited):
+        is_close, attrs, self_closing = tag.group(1), tag.group(2), tag.group(3)
+
+        if is_close:
+            if len(offsets) == 1:
+                return None # Unbalanced groups
+            offsets.pop()
+            if card_starts and card_starts[-1][0] == len(offsets):
+                _, start, key, x, y = card_starts.pop()
+                cards[key] = Card(start, tag.end(), x, y, _digest(edited[start:tag.end()]))
+                spans.append((start, tag.end()))
+            continue
+
+        dx, dy = 0.0, 0.0
+        transform: bytes | None = _attr(TRANSFORM_PATTERN, attrs)
+        if transform:
+            translate = TRANSLATE_ONLY_PATTERN.match(transform)
+            if not translate:
+                return None
+            dx = float(translate.group(1))
+            dy = float(translate.group(2) or 0)
+
+        parent_x, parent_y = offsets[-1]
+        x, y = parent_x + dx, parent_y + dy
+
+        if self_closing:
+            continue
+
+        classes: bytes = _attr(CLASS_PATTERN, attrs) or b""
+        if b"match" in classes.split() and not card_starts:
+            key: str = (_attr(MATCH_ID_PATTERN, attrs) or str(ordinal).encode()).decode()
+            ordinal += 1
+            card_starts.append((len(offsets), tag.start(), key, x, y))
+
+        offsets.append((x, y))
+
+    if not cards or len(offsets) != 1:
+        return None
+
+    return CardIndex(cards, _digest(_remove_spans(edited, spans)))
+
+def _remove_spans(content: bytes, spans: list[tuple[int, int]]) -> bytes:
+    parts: list[bytes] = []
+    position: int = 0
+    for start, end in sorted(spans):
+        parts.append(content[position:start])
+        position = end
+    parts.append(content[position:])
+    return b"".join(parts)
+
+def _intersects(a: Box, b: Box) -> bool:
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+def dirty_regions(old: CardIndex, new: CardIndex) -> list[Box] | None:
+    """Boxes to repaint between two renders, or None when a full render is needed"""
+    if old.skeleton_hash != new.skeleton_hash:
+        return None
+
+    regions: list[Box] = []
+    for key in old.cards.keys() | new.cards.keys():
+        before: Card | None = old.cards.get(key)
+        after: Card | None = new.cards.get(key)
+
+        if before and after and before.digest == after.digest and (before.x, before.y) == (after.x, after.y):
+            continue
+
+        if before:
+            regions.append(before.box)
+        if after and (not before or after.box != before.box):
+            regions.append(after.box)
+
+    return regions
+
+def region_document(edited: bytes, index: CardIndex, box: Box) -> bytes:
+    """The document cropped to a box, without the cards that cannot show up in it"""
+    hidden: list[tuple[int, int]] = [(card.start, card.end) for card in index.cards.values() if not _intersects(card.box, box)]
+    document: bytes = _remove_spans(edited, hidden)
+
+    root = ROOT_TAG_PATTERN.search(document)
+    assert root is not None
+    return set_root_viewport(document, root, *box)
+
+def read_view_box(edited: bytes) -> Box | None:
+    root = ROOT_TAG_PATTERN.search(edited)
+    view_box: bytes | None = root_attributes(root.group(0)).get(b'viewBox') if root else None
+    if not view_box:
+        return None
+
+    x, y, width, height = (float(v) for v in view_box.replace(b",", b" ").split())
+    return (x, y, width, height)
+
+def repaint(base: BaseRender, edited: bytes, index: CardIndex, render_png: Callable[[bytes, float], bytes]) -> bytes | None:
+    """
+    Repaint the changed cards of a bracket onto its last raster.
+    Returns the new lossless PNG, or None when a full render is needed.
+    """
+    view_box: Box | None = read_view_box(edited)
+    if view_box != base.view_box:
+        return None
+
+    regions: list[Box] | None = dirty_regions(base.index, index)
+    if regions is None:
+        return None
+
+    if not regions:
+        return base.png
+
+    from PIL import Image
+
+    scale: float = base.scale
+    with Image.open(io.BytesIO(base.png)) as source:
+        canvas: "Image.Image" = source.convert("RGB")
+
+    dirty_area: float = sum(w * h for _, _, w, h in regions) * scale * scale
+    if dirty_area > canvas.width * canvas.height * MAX_DIRTY_RATIO:
+        return None
+
+    vx, vy = view_box[0], view_box[1]
+    for x, y, width, height in regions:
+        # Snap the region to whole output pixels so the patch lines up with the canvas
+        left: int = max(0, math.floor((x - vx) * scale))
+        top: int = max(0, math.floor((y - vy) * scale))
+        right: int = min(canvas.width, math.ceil((x + width - vx) * scale))
+        bottom: int = min(canvas.height, math.ceil((y + height - vy) * scale))
+        if right <= left or bottom <= top:
+            continue
+
+        box: Box = (vx + left / scale, vy + top / scale, (right - left) / scale, (bottom - top) / scale)
+        patch_png: bytes = render_png(region_document(edited, index, box), scale)
+
+        with Image.open(io.BytesIO(patch_png)) as patch:
+            patch_rgb: "Image.Image" = patch.convert("RGB")
+            if patch_rgb.size != (right - left, bottom - top):
+                patch_rgb = patch_rgb.resize((right - left, bottom - top))
+            canvas.paste(patch_rgb, (left, top))
+
+    logger.info(f"Repainted {len(regions)} region(s) instead of the whole bracket")
+
+    with io.BytesIO() as buffer:
+        canvas.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
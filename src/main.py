@@ -1,55 +1,64 @@
+import time
+STARTED_AT: float = time.perf_counter() # Start of the startup budget, before the heavy imports
+
+import asyncio
 import os
-import io
 from datetime import datetime
-from typing import Any
 import logging
 from urllib.parse import urlparse
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
-from dotenv import load_dotenv
 import colorlog
 
-from json_handler import load_json, save_json
-from bracket_drawer import get_latest_bracket
-
-# Create logs folder
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
-# Setup color formater
-color_formatter = colorlog.ColoredFormatter(
-    fmt='%(black)s%(asctime)s %(log_color)s%(levelname)-8s %(reset)s%(blue)s%(name)-15s %(reset)s%(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    log_colors={
-        'DEBUG':    'cyan',
-        'INFO':     'green',
-        'WARNING':  'yellow',
-        'ERROR':    'red',
-        'CRITICAL': 'red,bg_white',
-    }
-)
-
-# Setup stream handler
-stream_handler = colorlog.StreamHandler()
-stream_handler.setFormatter(color_formatter)
-
-# Setup file handler
-file_handler = logging.FileHandler(filename='logs/challonge-snap.log', encoding='utf-8', mode='w')
-file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s %(name)-15s %(message)s'))
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=[stream_handler, file_handler]
-)
+from settings import Settings, load_settings
+from state_store import StateStore, init_store
+from bracket_drawer import BracketUpdate, get_latest_bracket
+from challonge_client import create_client
+from render_engine import RenderEngine, create_render_engine
+from tournament_registry import TournamentRegistry, TrackedTournament
+from poll_scheduler import AdaptiveInterval, PollOutcome, PollScheduler
+from shard_pool import ShardPool
+from metrics import MetricsServer, metrics, span
+from single_flight import SingleFlight
+from delivery_queue import Delivery, DeliveryQueue
+from status_poller import StatusPoller, create_status_poller
+
 logger = logging.getLogger('challonge-snap')
 
-# Load the token from the .env file
-load_dotenv()
-DISCORD_BOT_TOKEN: str | None = os.getenv('DISCORD_BOT_TOKEN')
-CHALLONGE_API_KEY: str | None = os.getenv('CHALLONGE_API_KEY')
+def setup_logging() -> None:
+    """Log to the console in colour and to logs/challonge-snap.log"""
+    # Create logs folder
+    if not os.path.exists('logs'):
+        os.makedirs('logs')
+
+    # Setup color formater
+    color_formatter = colorlog.ColoredFormatter(
+        fmt='%(black)s%(asctime)s %(log_color)s%(levelname)-8s %(reset)s%(blue)s%(name)-15s %(reset)s%(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        log_colors={
+            'DEBUG':    'cyan',
+            'INFO':     'green',
+            'WARNING':  'yellow',
+            'ERROR':    'red',
+            'CRITICAL': 'red,bg_white',
+        }
+    )
+
+    # Setup stream handler
+    stream_handler = colorlog.StreamHandler()
+    stream_handler.setFormatter(color_formatter)
+
+    # Setup file handler
+    file_handler = logging.FileHandler(filename='logs/challonge-snap.log', encoding='utf-8', mode='w')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s %(name)-15s %(message)s'))
+
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        handlers=[stream_handler, file_handler]
+    )
 
 class TournamentCog(commands.Cog):
     def __init__(self, bot: "DiscordBot"):
@@ -70,81 +79,80 @@ class TournamentCog(commands.Cog):
     async def bracket(self, interaction: discord.Interaction, id: str):
         await interaction.response.defer(ephemeral=True)
         
-        if not interaction.channel or not isinstance(interaction.channel, discord.abc.Messageable):
-            await interaction.response.send_message("Use this in a text channel.", ephemeral=True)
+        if not interaction.channel_id or not isinstance(interaction.channel, discord.abc.Messageable):
+            await interaction.followup.send("Use this in a text channel.", ephemeral=True)
             return
 
-        # Update internal state
+        # Add the bracket to the registry
         clean_id: str = self.extract_bracket_id(id)
-        self.bot.bracket_id = clean_id
-        self.bot.last_channel_id = interaction.channel_id
-        self.bot.is_complete = False
-        
-        # Update and save JSON
-        self.bot.user_data.update({
-            "bracket_id": self.bot.bracket_id ,
-            "last_channel_id": self.bot.last_channel_id,
-            "is_complete": self.bot.is_complete
-        })
-        save_json(self.bot.user_data)
+        tracked: TrackedTournament = self.bot.registry.track(interaction.guild_id, interaction.channel_id, clean_id)
 
         try:
-            await self.bot.update_and_send_bracket(interaction.channel)
-            await interaction.followup.send(f"Now tracking: https://challonge.com/{id}", ephemeral=True)
+            await self.bot.update_and_send_bracket(interaction.channel, tracked)
+            await interaction.followup.send(f"Now tracking: https://challonge.com/{clean_id}", ephemeral=True)
             
         except Exception as e:
             await interaction.followup.send(f"Error tracking bracket: {e}", ephemeral=True)
 
-        # Start the loop
-        if self.bot.refresh_bracket_loop.is_running():
-            self.bot.refresh_bracket_loop.restart()
-        else:
-            self.bot.refresh_bracket_loop.start()
+        # Schedule the next refresh
+        if (not tracked.is_complete) and (self.bot.settings.challonge_api_key):
+            self.bot.scheduler.track(tracked.key, delay=self.bot.scheduler.interval)
 
     # Slash Command: /info
     @app_commands.command(name="info", description="Get tracking info")
     async def info(self, interaction: discord.Interaction):
-        if self.bot.bracket_id:
-            await interaction.response.send_message(f"Currently tracking: https://challonge.com/{self.bot.bracket_id}.svg", ephemeral=True)
+        tracked_list: list[TrackedTournament] = self.bot.registry.in_guild(interaction.guild_id)
+
+        if tracked_list:
+            lines: list[str] = [f"- https://challonge.com/{t.tournament_id} in <#{t.channel_id}>" for t in tracked_list]
+            await interaction.response.send_message("Currently tracking:\n" + "\n".join(lines), ephemeral=True)
         else:
             await interaction.response.send_message("No bracket is currently being tracked. Use `/bracket` to set one.", ephemeral=True)
 
     # Slash Command: /update
     @app_commands.command(name="update", description="Update the bracket immediately")
     async def update(self, interaction: discord.Interaction):
-        if not self.bot.bracket_id:
+        tracked_list: list[TrackedTournament] = self.bot.registry.in_channel(interaction.channel_id or 0)
+
+        if not tracked_list:
             await interaction.response.send_message("No bracket is currently being tracked.", ephemeral=True)
             return
         
-        self.bot.refresh_bracket_loop.restart()
+        for tracked in tracked_list:
+            self.bot.scheduler.trigger(tracked.key)
+
         await interaction.response.send_message("Bracket updated", ephemeral=True)
 
     # Slash Command: /clear
     @app_commands.command(name="clear", description="Clear bot data and stop tracking bracket")
     async def clear(self, interaction: discord.Interaction):
-        logger.info("[/clear] Clearing data.json")
+        logger.info(f"[/clear] Clearing brackets in channel {interaction.channel_id}")
 
-        # Stop the loop
-        if self.bot.refresh_bracket_loop.is_running():
-            self.bot.refresh_bracket_loop.cancel()
-        
-        # Update internal state
-        self.bot.bracket_id = None
-        self.bot.last_channel_id = None
-        self.bot.is_complete = True
-        self.bot.msg_id = None
-
-        # Update and save JSON
-        self.bot.user_data.update({
-            "bracket_id": self.bot.bracket_id ,
-            "last_channel_id": self.bot.last_channel_id,
-            "is_complete": self.bot.is_complete,
-            "last_message_id": self.bot.msg_id
-        })
-        save_json(self.bot.user_data)
+        # Stop tracking every bracket of this channel
+        for tracked in self.bot.registry.in_channel(interaction.channel_id or 0):
+            self.bot.stop_tracking(tracked)
 
         await interaction.response.send_message("Data clear!", ephemeral=True)
 
+    # Slash Command: /stats
+    @app_commands.command(name="stats", description="Show refresh timings (bot owner only)")
+    @app_commands.describe(id="Only show this bracket")
+    async def stats(self, interaction: discord.Interaction, id: str | None = None):
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("Only the bot owner can use this command.", ephemeral=True)
+            return
+
+        tournament: str | None = self.extract_bracket_id(id) if id else None
+        lines: list[str] = metrics.summary(tournament)
+
+        if not tournament:
+            lines += [f"{name}: {value}" for name, value in sorted(metrics.counters.items())]
+            if self.bot.renderer:
+                lines.append(f"render queue: {self.bot.renderer.queued}")
+
+        text: str = "\n".join(lines) or "No data yet."
+        await interaction.response.send_message(f"```\n{text[:1900]}\n```", ephemeral=True)
+
     # Prefix Command: c!sync -> Update discord slash commands
     @commands.command(name="sync")
     @commands.is_owner()
@@ -173,123 +181,294 @@ class TournamentCog(commands.Cog):
             await ctx.send(f"Synced {len(synced)} commands globally.")
 
 class DiscordBot(commands.Bot):
-    def __init__(self):
+    def __init__(self, settings: Settings):
         intents = discord.Intents.default()
         intents.message_content = True # Read commands
         
         # Define the command prefix
         super().__init__(command_prefix='c!', intents=intents)
+        self.settings = settings
         
         # Load initial state
-        self.user_data: dict[str, Any] = load_json()
-        self.bracket_id: str | None = self.user_data.get("bracket_id")
-        self.last_channel_id: int | None = self.user_data.get("last_channel_id")
-        self.is_complete: bool = self.user_data.get("is_complete", True)
-        self.msg_id: int | None = self.user_data.get("last_message_id")
+        self.store: StateStore = init_store(settings.state_backend, flush_delay=settings.state_flush_seconds)
+        self.registry = TournamentRegistry(self.store)
+        self.challonge = create_client(settings)
+        self.statuses: StatusPoller | None = create_status_poller(settings, self.challonge)
+
+        # Poll and render here, or in shard worker processes that send their updates back
+        self.renderer: RenderEngine | None = None
+        self.shards: ShardPool | None = None
+        self.scheduler: PollScheduler | ShardPool
+        if settings.shard_workers > 0:
+            self.shards = ShardPool(settings, lookup=self.registry.get, on_update=self.publish_shard_update)
+            self.scheduler = self.shards
+        else:
+            self.renderer = create_render_engine(settings, workers=settings.render_workers)
+            self.scheduler = PollScheduler(
+                self.refresh_tracked,
+                interval=settings.poll_interval_minutes * 60,
+                max_concurrency=settings.max_concurrent_polls,
+                backpressure=self.renderer.wait_for_capacity,
+                policy=AdaptiveInterval(
+                    initial=settings.poll_interval_minutes * 60,
+                    floor=settings.poll_min_minutes * 60,
+                    ceiling=settings.poll_max_minutes * 60
+                )
+            )
+        self.refreshes = SingleFlight()
+        self.delivery = DeliveryQueue(
+            max_concurrency=settings.delivery_concurrency,
+            channel_interval=settings.delivery_channel_interval
+        )
+        self.metrics_server: MetricsServer | None = None
+        if settings.metrics_port:
+            self.metrics_server = MetricsServer(port=settings.metrics_port)
+
+        self._render_warmup: asyncio.Task[None] | None = None
+        self._ready_logged: bool = False
+
+    async def _warm_up_renderer(self, renderer: RenderEngine) -> None:
+        """Spawn the render workers in the background, the first render starts them otherwise"""
+        start: float = time.perf_counter()
+        try:
+            await renderer.start()
+        except Exception as e:
+            logger.error(f"Render pool warm-up failed: {e}")
+            return
+        logger.info(f"Render pool ready in {time.perf_counter() - start:.2f}s")
 
     async def setup_hook(self) -> None:
-        """Start the 10-minute background loop"""
+        """Start the shared polling scheduler"""
         await self.add_cog(TournamentCog(self))
 
-        if (not self.is_complete) and (CHALLONGE_API_KEY):
-            logger.info(f"Starting bracket loop for {self.bracket_id}")
-            self.refresh_bracket_loop.start()
+        # Connecting to the gateway does not wait for the render workers
+        if self.renderer:
+            self._render_warmup = asyncio.create_task(self._warm_up_renderer(self.renderer))
+
+        if self.metrics_server:
+            await self.metrics_server.start()
+
+        if self.settings.challonge_api_key:
+            for tracked in self.registry.active():
+                self.scheduler.track(tracked.key)
+
+            logger.info(f"Starting scheduler for {len(self.registry.active())} bracket(s)")
+
+        # Shard workers also serve the one-off /bracket renders
+        if self.settings.challonge_api_key or self.shards:
+            self.scheduler.start()
+
+    def assign_guilds(self) -> None:
+        """Move brackets migrated without a guild under the guild of their channel, once the channels are cached"""
+        for tracked in [t for t in self.registry.all() if t.guild_id is None]:
+            guild: discord.Guild | None = getattr(self.get_channel(tracked.channel_id), "guild", None)
+            if not guild:
+                continue
+
+            old_key: str = tracked.key
+            kept: TrackedTournament = self.registry.assign_guild(tracked, guild.id)
+            logger.info(f"Moved legacy bracket {tracked.tournament_id} to guild {guild.id}")
+
+            self.scheduler.untrack(old_key)
+            if kept is tracked and not tracked.is_complete and self.settings.challonge_api_key:
+                self.scheduler.track(tracked.key)
+
+    def stop_tracking(self, tracked: TrackedTournament) -> None:
+        """Remove a bracket from the registry and the scheduler"""
+        self.scheduler.untrack(tracked.key)
+        self.registry.remove(tracked.key)
+
+        # Other channels may still track the tournament and show its history in /stats
+        if not any(t.tournament_id == tracked.tournament_id for t in self.registry.all()):
+            metrics.forget(tracked.tournament_id)
     
-    async def update_and_send_bracket(self, channel: discord.abc.Messageable) -> None:
-        """Logic to fetch SVG, convert, and send to Discord"""
-        if not self.bracket_id:
-            return
+    async def fetch_update(self, tracked: TrackedTournament) -> BracketUpdate:
+        """Fetch and render a bracket in this process, or on its shard worker"""
+        if self.renderer:
+            return await get_latest_bracket(
+                self.challonge, self.renderer, tracked, native=self.settings.bracket_renderer == 'native', statuses=self.statuses
+            )
+        return await self.shards.refresh(tracked) # type: ignore[union-attr]
+
+    async def update_and_send_bracket(
+        self,
+        channel: discord.abc.Messageable,
+        tracked: TrackedTournament,
+        update: BracketUpdate | None = None
+    ) -> PollOutcome:
+        """
+        Logic to fetch SVG, convert, and send to Discord, or only send an update a shard worker already fetched.
+        A refresh already running for this bracket (scheduled tick, /update or /bracket) is joined instead of repeated.
+        """
+        return await self.refreshes.run(tracked.key, lambda: self._update_and_send_bracket(channel, tracked, update))
+
+    async def _update_and_send_bracket(
+        self,
+        channel: discord.abc.Messageable,
+        tracked: TrackedTournament,
+        update: BracketUpdate | None
+    ) -> PollOutcome:
+        outcome: PollOutcome = PollOutcome.UNCHANGED
 
         try:
-            image_bytes, is_complete = await get_latest_bracket(self.bracket_id)
+            if update is None:
+                update = await self.fetch_update(tracked)
+            images: list[bytes] | None = update.images
             
-            if image_bytes:
+            if images:
                 # Get current time 
                 current_time: str = datetime.now().strftime("%Y-%m-%d %I:%M %p")
                 current_time_text: str = f"-# Last update: {current_time}"
 
-                with io.BytesIO(image_bytes) as image_binary:
-                    file = discord.File(fp=image_binary, filename="bracket.png")
-                    last_msg: discord.Message | None = None
-
-                    if self.msg_id:
-                        try:
-                            last_msg = await channel.fetch_message(self.msg_id)
-                        except discord.NotFound:
-                            last_msg = None # Message was deleted, send new message
-
-                    if last_msg:
-                        await last_msg.edit(content=current_time_text, attachments=[file]) # Edit existing message with the new image
-                    else:
-                        # Send new message and save message ID
-                        new_msg = await channel.send(content=current_time_text, file=file)
-                        self.msg_id = new_msg.id
-
-                        # Update json
-                        self.user_data["last_message_id"] = self.msg_id
-                        save_json(self.user_data)
+                # One attachment per tile for brackets rendered in tiles
+                extension: str = self.settings.image_format
+                if len(images) == 1:
+                    attachments: list[tuple[str, bytes]] = [(f"bracket.{extension}", images[0])]
+                else:
+                    attachments = [(f"bracket-{i + 1}.{extension}", image) for i, image in enumerate(images)]
+
+                def delivered(message_id: int, update: BracketUpdate = update) -> None:
+                    # Only remember the update once it has been delivered
+                    tracked.message_id = message_id
+                    update.commit(tracked)
+                    if self.registry.get(tracked.key) is tracked:
+                        self.registry.save(tracked)
+                        if self.shards:
+                            self.shards.sync(tracked)
+
+                self.delivery.submit(Delivery(
+                    key=tracked.key,
+                    channel=channel,
+                    channel_id=tracked.channel_id,
+                    message_id=tracked.message_id,
+                    content=current_time_text,
+                    images=attachments,
+                    tournament_id=tracked.tournament_id,
+                    on_delivered=[delivered]
+                ))
+                outcome = PollOutcome.CHANGED
+            elif update.unchanged:
+                logger.info(f"Bracket content unchanged for {tracked.tournament_id}")
+                update.commit(tracked)
+                # Not written back if /clear or completion removed it while the refresh ran
+                if self.registry.get(tracked.key) is tracked:
+                    self.registry.save(tracked)
+                    if self.shards:
+                        self.shards.sync(tracked)
+            elif update.error:
+                logger.info(f"Could not refresh {tracked.tournament_id}")
+                outcome = PollOutcome.ERROR
             else:
-                logger.info(f"No updates for {self.bracket_id}")
-
-            if is_complete:
-                logger.info(f"Tournament {self.bracket_id} finished")
-
-                # Update internal state
-                self.is_complete = True
-                self.bracket_id = None
-                self.last_channel_id = None
-                self.msg_id = None
-                
-                # Update and save JSON
-                self.user_data.update({
-                    "bracket_id": self.bracket_id ,
-                    "last_channel_id": self.last_channel_id,
-                    "is_complete": self.is_complete,
-                    "last_message_id": self.msg_id
-                })
-                save_json(self.user_data)
-
-                self.refresh_bracket_loop.stop()
-                return
+                logger.info(f"No updates for {tracked.tournament_id}")
+
+            if update.is_complete:
+                logger.info(f"Tournament {tracked.tournament_id} finished")
+                self.stop_tracking(tracked)
             
         except Exception as e:
             logger.error(f"Failed to update bracket: {e}")
+            outcome = PollOutcome.ERROR
 
-    async def on_ready(self) -> None:
-        """Event: Runs when the bot successfully connects"""
-        logger.info(f"{bot.user.name} (ID: {bot.user.id}) successfully connects") # type: ignore
+        return outcome
 
-    @tasks.loop(minutes=15)
-    async def refresh_bracket_loop(self) -> None:
-        """Refresh the bracket every 10 minutes"""
-        # Check if there is a bracket id and channel id
-        if not (self.bracket_id and self.last_channel_id):
-            return
-        
-        channel = self.get_channel(self.last_channel_id)
+    async def resolve_channel(self, tracked: TrackedTournament) -> discord.abc.Messageable | None:
+        """The channel of a tracked bracket; a deleted channel stops the tracking"""
+        channel = self.get_channel(tracked.channel_id)
         if not channel:
             try:
-                channel = await self.fetch_channel(self.last_channel_id)
+                channel = await self.fetch_channel(tracked.channel_id)
             except discord.NotFound:
-                logger.warning(f"Channel {self.last_channel_id} no longer exists")
-                self.refresh_bracket_loop.stop()
-                return
+                logger.warning(f"Channel {tracked.channel_id} no longer exists")
+                self.stop_tracking(tracked)
+                return None
+
+        return channel if isinstance(channel, discord.abc.Messageable) else None
+
+    async def refresh_tracked(self, key: str) -> PollOutcome | None:
+        """Scheduler callback: refresh one tracked bracket"""
+        tracked: TrackedTournament | None = self.registry.get(key)
+        if not tracked:
+            self.scheduler.untrack(key)
+            return None
+        
+        await self.wait_until_ready()
 
-        if isinstance(channel, discord.abc.Messageable):
-            logger.info(f"Auto-refreshing bracket: {self.bracket_id}")
-            await self.update_and_send_bracket(channel)
+        try:
+            channel: discord.abc.Messageable | None = await self.resolve_channel(tracked)
+        except discord.HTTPException as e:
+            logger.warning(f"Could not fetch channel {tracked.channel_id}: {e}")
+            return PollOutcome.ERROR
+
+        if channel:
+            logger.info(f"Auto-refreshing bracket: {tracked.tournament_id}")
+            with span("refresh", tracked.tournament_id):
+                outcome: PollOutcome = await self.update_and_send_bracket(channel, tracked)
+            metrics.increment(f"refresh_{outcome.name.lower()}")
+            return outcome
+
+        return None
+
+    async def publish_shard_update(self, key: str, update: BracketUpdate) -> None:
+        """Shard pool callback: send an update a worker polled and rendered"""
+        tracked: TrackedTournament | None = self.registry.get(key)
+        if not tracked:
+            self.scheduler.untrack(key)
+            return
 
-    @refresh_bracket_loop.before_loop
-    async def before_refresh_loop(self) -> None:
         await self.wait_until_ready()
 
+        try:
+            channel: discord.abc.Messageable | None = await self.resolve_channel(tracked)
+        except discord.HTTPException as e:
+            logger.warning(f"Could not fetch channel {tracked.channel_id}: {e}")
+            return
+
+        if channel:
+            outcome: PollOutcome = await self.update_and_send_bracket(channel, tracked, update)
+            metrics.increment(f"refresh_{outcome.name.lower()}")
+
+    async def on_ready(self) -> None:
+        """Event: Runs when the bot successfully connects"""
+        logger.info(f"{self.user.name} (ID: {self.user.id}) successfully connects") # type: ignore
+
+        # Time from process start to online, once (on_ready also fires after reconnects)
+        if not self._ready_logged:
+            self._ready_logged = True
+            elapsed: float = time.perf_counter() - STARTED_AT
+            metrics.observe("startup", elapsed)
+
+            budget: float = self.settings.startup_budget_seconds
+            if budget and elapsed > budget:
+                logger.warning(f"Startup took {elapsed:.2f}s, over the {budget:.0f}s budget")
+            else:
+                logger.info(f"Startup took {elapsed:.2f}s")
+
+            self.assign_guilds()
+
     async def close(self) -> None:
-        self.refresh_bracket_loop.stop()
+        if self._render_warmup:
+            self._render_warmup.cancel()
+        await self.scheduler.stop()
+        await self.delivery.close()
+        await self.challonge.close()
+        if self.renderer:
+            await self.renderer.close()
+        await self.store.close()
+        if self.metrics_server:
+            await self.metrics_server.close()
         await super().close()
 
-# Initialize bot
-bot = DiscordBot()
+def main() -> None:
+    setup_logging()
+    settings: Settings = load_settings()
+
+    if not settings.discord_bot_token:
+        logger.error("DISCORD_BOT_TOKEN is not set")
+        return
+
+    # Initialize and run the bot
+    bot = DiscordBot(settings)
+    bot.run(settings.discord_bot_token, log_handler=None)
 
-# Run the bot
-if DISCORD_BOT_TOKEN:
-    bot.run(DISCORD_BOT_TOKEN, log_handler=None)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import bisect
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any
+import logging
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Spans recorded inside a render job, sent back to the bot with the result
+_collector: ContextVar[list[tuple[str, float]] | None] = ContextVar("metrics_collector", default=None)
+
+class Histogram:
+    """Cumulative latency histogram with fixed buckets, in the Prometheus style."""
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1) # Last one is +Inf
+        self.count: int = 0
+        self.total: float = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0
+
+        rank: float = q * self.count
+        seen: int = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class Metrics:
+    """
+    Stage latencies and event counters for the whole bot.
+    Every stage is kept across the bot and per tournament.
+    """
+
+    def __init__(self) -> None:
+        self.started: float = time.time()
+        self.stages: dict[str, Histogram] = defaultdict(Histogram)
+        self.tournaments: dict[str, dict[str, Histogram]] = defaultdict(lambda: defaultdict(Histogram))
+        self.counters: dict[str, int] = defaultdict(int)
+
+        # Observations and increments not yet sent to the bot, in shard worker processes
+        self._outbox: list[tuple[str, float, str | None]] | None = None
+        self._counter_outbox: dict[str, int] = defaultdict(int)
+
+    def observe(self, stage: str, seconds: float, tournament: str | None = None) -> None:
+        self.stages[stage].observe(seconds)
+        if tournament:
+            self.tournaments[tournament][stage].observe(seconds)
+        if self._outbox is not None:
+            self._outbox.append((stage, seconds, tournament))
+
+    def increment(self, counter: str, amount: int = 1) -> None:
+        self.counters[counter] += amount
+        if self._outbox is not None:
+            self._counter_outbox[counter] += amount
+
+    def forward(self) -> None:
+        """Keep what is recorded from now on until `drain`, in a process that reports to the bot"""
+        self._outbox = []
+
+    def drain(self) -> tuple[list[tuple[str, float, str | None]], dict[str, int]]:
+        """Observations and counter increments since the last drain"""
+        observations: list[tuple[str, float, str | None]] = self._outbox or []
+        counters: dict[str, int] = dict(self._counter_outbox)
+
+        if self._outbox is not None:
+            self._outbox = []
+        self._counter_outbox.clear()
+        return observations, counters
+
+    def merge(self, observations: list[tuple[str, float, str | None]], counters: dict[str, int]) -> None:
+        """Add what another process drained"""
+        for stage, seconds, tournament in observations:
+            self.observe(stage, seconds, tournament)
+        for counter, amount in counters.items():
+            self.increment(counter, amount)
+
+    def forget(self, tournament: str) -> None:
+        """Drop the histograms of a tournament that is no longer tracked"""
+        self.tournaments.pop(tournament, None)
+
+    def record(self, spans: list[tuple[str, float]], tournament: str | None = None) -> None:
+        """Record spans collected in a render worker"""
+        for stage, seconds in spans:
+            self.observe(stage, seconds, tournament)
+
+    def summary(self, tournament: str | None = None) -> list[str]:
+        """One line per stage: count, mean, p50 and p95"""
+        stages: dict[str, Histogram] = self.tournaments.get(tournament, {}) if tournament else self.stages
+
+        lines: list[str] = []
+        for stage, histogram in sorted(stages.items()):
+            lines.append(
+                f"{stage}: {histogram.count}x, mean {histogram.mean * 1000:.0f}ms, "
+                f"p50 ≤{histogram.quantile(0.5) * 1000:.0f}ms, p95 ≤{histogram.quantile(0.95) * 1000:.0f}ms"
+            )
+        return lines
+
+    def prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        lines: list[str] = ["# TYPE challonge_snap_stage_seconds histogram"]
+
+        def histogram_lines(histogram: Histogram, labels: str) -> None:
+            cumulative: int = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'challonge_snap_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'challonge_snap_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'challonge_snap_stage_seconds_sum{{{labels}}} {histogram.total}')
+            lines.append(f'challonge_snap_stage_seconds_count{{{labels}}} {histogram.count}')
+
+        for stage, histogram in sorted(self.stages.items()):
+            histogram_lines(histogram, f'stage="{stage}"')
+
+        for tournament, stages in sorted(self.tournaments.items()):
+            for stage, histogram in sorted(stages.items()):
+                histogram_lines(histogram, f'stage="{stage}",tournament="{tournament}"')
+
+        lines.append("# TYPE challonge_snap_events_total counter")
+        for counter, value in sorted(self.counters.items()):
+            lines.append(f'challonge_snap_events_total{{event="{counter}"}} {value}')
+
+        lines.append("# TYPE challonge_snap_start_time_seconds gauge")
+        lines.append(f"challonge_snap_start_time_seconds {self.started}")
+
+        return "\n".join(lines) + "\n"
+
+# Bot-wide metrics
+metrics = Metrics()
+
+@contextmanager
+def span(stage: str, tournament: str | None = None) -> Iterator[None]:
+    """Time a stage; inside a render job the span is collected for the bot instead"""
+    start: float = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed: float = time.perf_counter() - start
+        collected: list[tuple[str, float]] | None = _collector.get()
+        if collected is not None:
+            collected.append((stage, elapsed))
+        else:
+            metrics.observe(stage, elapsed, tournament)
+
+def collect(func: Callable[..., Any], *args: Any) -> tuple[Any, list[tuple[str, float]]]:
+    """Run a render job and return its result with the spans recorded while it ran"""
+    spans: list[tuple[str, float]] = []
+    token = _collector.set(spans)
+    try:
+        return func(*args), spans
+    finally:
+        _collector.reset(token)
+
+class MetricsServer:
+    """Optional local HTTP endpoint serving `/metrics` in the Prometheus text format."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100):
+        self.host = host
+        self.port = port
+        self._runner: "web.AppRunner | None" = None
+
+    async def _handle(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
+
+        return web.Response(text=metrics.prometheus(), content_type="text/plain", charset="utf-8")
+
+    async def start(self) -> None:
+        # The server side of aiohttp is only loaded when the endpoint is enabled
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def close(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,259 @@
+import hashlib
+import io
+import json
+from dataclasses import dataclass, field
+from typing import Any
+import logging
+
+from svg_editor import HEADER_OFFSET, MATCH_CARD_HEIGHT, MATCH_CARD_WIDTH
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+COLUMN_GAP = 40
+ROW_GAP = 20
+GROUP_GAP = 80
+NAME_FONT_SIZE = 12
+TITLE_FONT_SIZE = 28
+
+# Colours of the public Challonge bracket
+HEADER_COLOR = "#ff7324"
+ROW_COLORS = ("#787a80", "#5b5d61")
+WINNER_SCORE_COLOR = "#ff7324"
+LINE_COLOR = "#999999"
+TEXT_COLOR = "white"
+LABEL_COLOR = "#333333"
+
+@dataclass(frozen=True)
+class MatchBox:
+    """One match as drawn: player names, scores and the matches feeding it."""
+    id: int
+    round: int # Negative for the losers bracket
+    identifier: str
+    players: tuple[str, str]
+    scores: tuple[str, str]
+    winner: int | None # Index of the winning player
+    prereqs: tuple[int | None, int | None]
+    group: int | None
+    order: int
+
+@dataclass
+class BracketData:
+    """What the native renderer needs from the API, small and picklable for the render pool."""
+    name: str
+    tournament_type: str
+    matches: list[MatchBox] = field(default_factory=list)
+
+@dataclass
+class Layout:
+    width: float
+    height: float
+    positions: dict[int, tuple[float, float]] = field(default_factory=dict) # Top left corner of every card
+    labels: list[tuple[str, float, float]] = field(default_factory=list) # Group titles
+
+def _player_names(participants: list[dict[str, Any]]) -> dict[int, str]:
+    """Participant names by ID, group stage IDs included"""
+    names: dict[int, str] = {}
+    for entry in participants:
+        participant: dict[str, Any] = entry.get("participant", entry)
+        name: str = participant.get("display_name") or participant.get("name") or ""
+        names[participant["id"]] = name
+        for group_player_id in participant.get("group_player_ids") or []:
+            names[group_player_id] = name
+    return names
+
+def _split_scores(scores_csv: str | None) -> tuple[str, str]:
+    """'3-1,2-3' becomes ('3,2', '1,3'); negative scores are kept"""
+    if not scores_csv:
+        return "", ""
+
+    first: list[str] = []
+    second: list[str] = []
+    for score in scores_csv.split(","):
+        # Skip the first character so a negative first score keeps its sign
+        score = score.strip()
+        left, sep, right = score[1:].partition("-")
+        left = score[:1] + left
+        first.append(left)
+        second.append(right if sep else "")
+    return ",".join(first), ",".join(second)
+
+def parse_tournament(tournament: dict[str, Any]) -> BracketData:
+    """Build the drawable bracket from `tournaments/{id}.json` with matches and participants included"""
+    names: dict[int, str] = _player_names(tournament.get("participants") or [])
+    matches: list[MatchBox] = []
+
+    for entry in tournament.get("matches") or []:
+        match: dict[str, Any] = entry.get("match", entry)
+        players: tuple[int | None, int | None] = (match.get("player1_id"), match.get("player2_id"))
+
+        winner_id: int | None = match.get("winner_id")
+        winner: int | None = players.index(winner_id) if winner_id is not None and winner_id in players else None
+
+        matches.append(MatchBox(
+            id=match["id"],
+            round=match.get("round") or 0,
+            identifier=str(match.get("identifier") or ""),
+            players=(names.get(players[0], "") if players[0] else "", names.get(players[1], "") if players[1] else ""),
+            scores=_split_scores(match.get("scores_csv")),
+            winner=winner,
+            prereqs=(match.get("player1_prereq_match_id"), match.get("player2_prereq_match_id")),
+            group=match.get("group_id"),
+            order=match.get("suggested_play_order") or match["id"]
+        ))
+
+    return BracketData(tournament.get("name") or "", tournament.get("tournament_type") or "", matches)
+
+def hash_bracket(bracket: BracketData) -> str:
+    """Hash of everything that is drawn, used to detect unchanged brackets"""
+    payload: bytes = json.dumps([bracket.name, bracket.tournament_type, [list(vars(m).values()) for m in bracket.matches]]).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+def _layout_elimination(matches: list[MatchBox], layout: Layout, top: float) -> float:
+    """Winners then losers rounds as columns, each card centred on the matches feeding it"""
+    bottom: float = top
+    slot: float = MATCH_CARD_HEIGHT + ROW_GAP
+
+    for section in ([m for m in matches if m.round >= 0], [m for m in matches if m.round < 0]):
+        if not section:
+            continue
+
+        section_ids: set[int] = {m.id for m in section}
+        rounds: list[int] = sorted({abs(m.round) for m in section})
+
+        for column, round_number in enumerate(rounds):
+            next_free: float = top
+            for match in sorted((m for m in section if abs(m.round) == round_number), key=lambda m: m.order):
+                feeders: list[float] = [
+                    layout.positions[p][1] for p in match.prereqs if p in section_ids and p in layout.positions
+                ]
+                y: float = max(sum(feeders) / len(feeders) if feeders else next_free, next_free)
+                layout.positions[match.id] = (column * (MATCH_CARD_WIDTH + COLUMN_GAP), y)
+                next_free = y + slot
+                bottom = max(bottom, next_free)
+
+            layout.width = max(layout.width, (column + 1) * (MATCH_CARD_WIDTH + COLUMN_GAP))
+
+        top = bottom + GROUP_GAP
+
+    return bottom
+
+def _layout_rounds(matches: list[MatchBox], layout: Layout, top: float) -> float:
+    """One column per round, matches stacked in play order (round robin, swiss)"""
+    slot: float = MATCH_CARD_HEIGHT + ROW_GAP
+    rounds: list[int] = sorted({m.round for m in matches})
+    bottom: float = top
+
+    for column, round_number in enumerate(rounds):
+        in_round: list[MatchBox] = sorted((m for m in matches if m.round == round_number), key=lambda m: m.order)
+        for row, match in enumerate(in_round):
+            layout.positions[match.id] = (column * (MATCH_CARD_WIDTH + COLUMN_GAP), top + row * slot)
+        bottom = max(bottom, top + len(in_round) * slot)
+        layout.width = max(layout.width, (column + 1) * (MATCH_CARD_WIDTH + COLUMN_GAP))
+
+    return bottom
+
+def layout_bracket(bracket: BracketData) -> Layout:
+    """Place every match card. Group stages come first, then the main stage by tournament type."""
+    layout = Layout(0, 0)
+    top: float = HEADER_OFFSET
+
+    groups: list[int] = sorted({m.group for m in bracket.matches if m.group is not None})
+    for number, group in enumerate(groups, start=1):
+        layout.labels.append((f"Group {number}", 0, top))
+        top = _layout_rounds([m for m in bracket.matches if m.group == group], layout, top + 20) + GROUP_GAP
+
+    main_stage: list[MatchBox] = [m for m in bracket.matches if m.group is None]
+    if "elimination" in bracket.tournament_type:
+        bottom: float = _layout_elimination(main_stage, layout, top)
+    else:
+        bottom = _layout_rounds(main_stage, layout, top)
+
+    layout.width = max(layout.width - COLUMN_GAP, MATCH_CARD_WIDTH)
+    layout.height = bottom
+    return layout
+
+def _font(size: float) -> Any:
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.load_default(size=size)
+    except (TypeError, OSError):
+        # Pillow without FreeType only has the fixed bitmap font
+        return ImageFont.load_default()
+
+def _fit_text(draw: Any, text: str, font: Any, width: float) -> str:
+    """Cut a name with an ellipsis so it stays inside its row"""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+def draw_bracket(bracket: BracketData, layout: Layout, scale: float = 2, padding: int = 40) -> bytes:
+    """Draw the laid out bracket straight into a raster and return it as PNG"""
+    # Parsing and layout run in the bot process, Pillow only loads in the render workers
+    from PIL import Image, ImageDraw
+
+    def px(value: float) -> int:
+        return round(value * scale)
+
+    width: float = layout.width + padding * 2
+    height: float = layout.height + padding * 1.5
+    image = Image.new("RGB", (px(width), px(height)), "white")
+    draw = ImageDraw.Draw(image)
+
+    name_font = _font(NAME_FONT_SIZE * scale)
+    title_font = _font(TITLE_FONT_SIZE * scale)
+
+    def at(x: float, y: float) -> tuple[int, int]:
+        return px(x + padding), px(y + padding)
+
+    # Header
+    draw.rectangle([at(0, 0), at(layout.width, HEADER_OFFSET - 20)], fill=HEADER_COLOR)
+    draw.text(at(20, 30), bracket.name, fill=TEXT_COLOR, font=title_font)
+
+    for label, x, y in layout.labels:
+        draw.text(at(x, y - 4), label, fill=LABEL_COLOR, font=name_font)
+
+    # Connectors under the cards
+    by_id: dict[int, MatchBox] = {m.id: m for m in bracket.matches}
+    for match in bracket.matches:
+        if match.id not in layout.positions:
+            continue
+        x, y = layout.positions[match.id]
+        for prereq in match.prereqs:
+            feeder: MatchBox | None = by_id.get(prereq) if prereq else None
+            if not feeder or feeder.id not in layout.positions or (feeder.round < 0) != (match.round < 0):
+                continue
+            fx, fy = layout.positions[feeder.id]
+            start_x: float = fx + MATCH_CARD_WIDTH
+            mid_x: float = (start_x + x) / 2
+            start_y: float = fy + MATCH_CARD_HEIGHT / 2
+            end_y: float = y + MATCH_CARD_HEIGHT / 2
+            draw.line([at(start_x, start_y), at(mid_x, start_y), at(mid_x, end_y), at(x, end_y)], fill=LINE_COLOR, width=max(1, px(2)))
+
+    # Match cards
+    row_height: float = MATCH_CARD_HEIGHT / 2
+    for match in bracket.matches:
+        if match.id not in layout.positions:
+            continue
+        x, y = layout.positions[match.id]
+
+        if match.identifier:
+            draw.text(at(x - 18, y + row_height - 6), match.identifier, fill=LABEL_COLOR, font=name_font)
+
+        for row in range(2):
+            top: float = y + row * row_height
+            draw.rectangle([at(x, top), at(x + MATCH_CARD_WIDTH, top + row_height)], fill=ROW_COLORS[row])
+
+            if match.winner == row:
+                draw.rectangle([at(x + MATCH_CARD_WIDTH - 30, top), at(x + MATCH_CARD_WIDTH, top + row_height)], fill=WINNER_SCORE_COLOR)
+
+            name: str = _fit_text(draw, match.players[row], name_font, px(MATCH_CARD_WIDTH - 50))
+            draw.text(at(x + 10, top + 7), name, fill=TEXT_COLOR, font=name_font)
+            draw.text(at(x + MATCH_CARD_WIDTH - 22, top + 7), match.scores[row], fill=TEXT_COLOR, font=name_font)
+
+    with io.BytesIO() as buffer:
+        image.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
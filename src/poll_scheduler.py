@@ -0,0 +1,196 @@
+import asyncio
+import math
+import random
+from collections.abc import Awaitable, Callable
+from enum import Enum
+import logging
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+class PollOutcome(Enum):
+    """What a refresh found, used to pick the next polling interval."""
+    CHANGED = "changed"
+    UNCHANGED = "unchanged"
+    ERROR = "error"
+
+RefreshCallback = Callable[[str], Awaitable[PollOutcome | None]]
+BackpressureHook = Callable[[], Awaitable[None]]
+
+class AdaptiveInterval:
+    """
+    Per-key polling interval.
+    Shrinks toward `floor` while the bracket keeps changing, grows toward
+    `ceiling` while it is idle and uses jittered exponential backoff on errors.
+    """
+
+    def __init__(
+        self,
+        initial: float = 15 * 60,
+        floor: float = 60,
+        ceiling: float = 30 * 60,
+        speedup: float = 0.5,
+        slowdown: float = 1.5,
+        error_base: float = 30
+    ):
+        self.initial = initial
+        self.floor = floor
+        self.ceiling = ceiling
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.error_base = error_base
+
+        self._intervals: dict[str, float] = {}
+        self._failures: dict[str, int] = {}
+
+    def current(self, key: str) -> float:
+        return self._intervals.get(key, self.initial)
+
+    def next_delay(self, key: str, outcome: PollOutcome) -> float:
+        """Delay until the next poll of a key after a refresh with the given outcome"""
+        if outcome is PollOutcome.ERROR:
+            failures: int = self._failures.get(key, 0) + 1
+            self._failures[key] = failures
+
+            # Equal jitter: half fixed, half random, so failing brackets do not retry in lockstep
+            backoff: float = min(self.ceiling, self.error_base * (2 ** (failures - 1)))
+            return backoff / 2 + random.uniform(0, backoff / 2)
+
+        self._failures.pop(key, None)
+        interval: float = self.current(key)
+
+        if outcome is PollOutcome.CHANGED:
+            interval = max(self.floor, interval * self.speedup)
+        else:
+            interval = min(self.ceiling, interval * self.slowdown)
+
+        self._intervals[key] = interval
+        return interval
+
+    def forget(self, key: str) -> None:
+        self._intervals.pop(key, None)
+        self._failures.pop(key, None)
+
+class PollScheduler:
+    """
+    One background task that polls every tracked bracket.
+    Each key has its own due time, polls are spread over the interval and
+    at most `max_concurrency` refreshes are in flight at once.
+    When the refresh callback reports an outcome, the key's next poll is
+    picked by the adaptive interval policy.
+    An optional back-pressure hook is awaited before each refresh starts,
+    so a backed-up render queue slows polling down instead of piling up work.
+    """
+
+    def __init__(
+        self,
+        refresh: RefreshCallback,
+        interval: float = 15 * 60,
+        max_concurrency: int = 8,
+        backpressure: BackpressureHook | None = None,
+        policy: AdaptiveInterval | None = None
+    ):
+        self.refresh = refresh
+        self.backpressure = backpressure
+        self.interval = interval
+        self.policy = policy
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+        self._due: dict[str, float] = {}
+        self._in_flight: dict[str, asyncio.Task[None]] = {}
+        self._wake = asyncio.Event()
+        self._runner: asyncio.Task[None] | None = None
+
+    def is_running(self) -> bool:
+        return self._runner is not None and not self._runner.done()
+
+    def start(self) -> None:
+        if not self.is_running():
+            self._runner = asyncio.create_task(self._run(), name="poll-scheduler")
+
+    async def stop(self) -> None:
+        """Stop scheduling and cancel in-flight refreshes"""
+        if self._runner:
+            self._runner.cancel()
+            self._runner = None
+
+        for task in list(self._in_flight.values()):
+            task.cancel()
+
+        await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+        self._in_flight.clear()
+
+    def track(self, key: str, delay: float | None = None) -> None:
+        """
+        Schedule a key. Without a delay, the first poll lands at a random point
+        of the interval so brackets restored on startup do not all fire together.
+        """
+        if delay is None:
+            delay = random.uniform(0, self.interval)
+
+        self._due[key] = asyncio.get_running_loop().time() + delay
+        self._wake.set()
+
+    def untrack(self, key: str) -> None:
+        self._due.pop(key, None)
+        if self.policy:
+            self.policy.forget(key)
+        self._wake.set()
+
+    def trigger(self, key: str) -> None:
+        """Poll a key as soon as possible"""
+        self.track(key, delay=0)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._due
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            self._wake.clear()
+            now: float = loop.time()
+
+            for key, due in list(self._due.items()):
+                if due <= now and key not in self._in_flight:
+                    # With a policy, the next poll is picked once the refresh is done
+                    # Otherwise it is counted from dispatch so slow refreshes do not drift the schedule
+                    self._due[key] = math.inf if self.policy else now + self.interval
+                    self._in_flight[key] = asyncio.create_task(self._poll(key), name=f"poll-{key}")
+
+            # Sleep until the next due key or until the schedule changes
+            waiting: list[float] = [due for key, due in self._due.items() if key not in self._in_flight]
+            timeout: float | None = None
+            if waiting:
+                timeout = max(0.0, min(waiting) - loop.time())
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, key: str) -> None:
+        try:
+            async with self.semaphore:
+                if self.backpressure:
+                    await self.backpressure()
+
+                if key not in self._due:
+                    return
+
+                outcome: PollOutcome | None = await self.refresh(key)
+
+                # Reschedule from the end of the refresh, keeping an earlier trigger() if one came in
+                if self.policy and key in self._due:
+                    delay: float = self.policy.next_delay(key, outcome) if outcome else self.policy.current(key)
+                    self._due[key] = min(self._due[key], asyncio.get_running_loop().time() + delay)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Refresh failed for {key}: {e}")
+            if self.policy and key in self._due:
+                delay = self.policy.next_delay(key, PollOutcome.ERROR)
+                self._due[key] = min(self._due[key], asyncio.get_running_loop().time() + delay)
+        finally:
+            self._in_flight.pop(key, None)
+            self._wake.set()
@@ -0,0 +1,444 @@
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any
+import logging
+
+from image_cache import ImageCache, make_cache_key
+from image_encoder import IMAGE_FORMATS, encode_image, pick_scale
+from metrics import collect, metrics, span
+from single_flight import SingleFlight
+from incremental_render import BaseRender, index_cards, read_view_box, repaint
+from native_renderer import BracketData, draw_bracket, layout_bracket
+from settings import Settings
+from svg_editor import fit_svg, tile_svg
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+# cairosvg module of the current worker, imported once by the initializer
+_cairosvg: Any = None
+
+def _init_worker() -> None:
+    """Worker initializer: pay the cairosvg/cffi import once per process"""
+    global _cairosvg
+    try:
+        import cairosvg
+    except (ImportError, OSError) as e:
+        # Native renders do not need Cairo; SVG renders import it again and fail there
+        logger.warning(f"cairosvg unavailable in render worker: {e}")
+        return
+    _cairosvg = cairosvg
+
+def _warm() -> int:
+    """No-op job used to spawn the workers ahead of the first render"""
+    return os.getpid()
+
+def render_png(svg: bytes, scale: float = 2) -> bytes:
+    """Rasterize an SVG into PNG bytes (runs inside a worker)"""
+    if _cairosvg is None:
+        _init_worker()
+
+    with span("rasterize"):
+        return _cairosvg.svg2png(bytestring=svg, scale=scale)
+
+@dataclass(frozen=True)
+class RenderOptions:
+    """How brackets are rasterized and encoded. Picklable, so it travels with every job."""
+    scale: float = 2 # Fixed scale, or the upper bound with `adaptive_scale`
+    padding: int = 40
+    adaptive_scale: bool = True
+    min_scale: float = 1
+    target_pixels: int = 8 * 1024 * 1024
+    tile_max_pixels: int | None = None
+    image_format: str = "png"
+    colors: int = 128 # Palette size, 0 keeps full colour
+    max_bytes: int | None = 8 * 1024 * 1024 # Byte budget per message
+    incremental: bool = True # Repaint only the changed match cards when possible
+
+    def __post_init__(self) -> None:
+        if self.image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format {self.image_format}, expected one of {IMAGE_FORMATS}")
+
+    def cache_params(self) -> tuple[Any, ...]:
+        """Everything that changes the output, for the image cache key"""
+        return (
+            self.scale, self.padding, self.adaptive_scale, self.min_scale, self.target_pixels,
+            self.tile_max_pixels, self.image_format, self.colors, self.max_bytes
+        )
+
+def encode_png(png: bytes, options: RenderOptions, parts: int = 1) -> bytes:
+    """Encode a raster for upload, sharing the byte budget between the parts of a message"""
+    max_bytes: int | None = options.max_bytes // parts if options.max_bytes else None
+    with span("encode"):
+        return encode_image(png, options.image_format, options.colors, max_bytes)
+
+def render_tile(svg: bytes, scale: float, options: RenderOptions, parts: int) -> bytes:
+    """Rasterize and encode one tile (runs inside a worker)"""
+    return encode_png(render_png(svg, scale), options, parts)
+
+def _prepare(svg: bytes, options: RenderOptions) -> tuple[bytes, float, list[bytes]]:
+    """Fitted document, its scale and its tiles (empty when it fits in one image)"""
+    with span("edit_svg"):
+        edited, width, height = fit_svg(svg, options.padding)
+
+    scale: float = options.scale
+    if options.adaptive_scale:
+        scale = pick_scale(width, height, options.min_scale, options.scale, options.target_pixels)
+
+    if options.tile_max_pixels:
+        tiles, scale = tile_svg(edited, scale, options.tile_max_pixels, min_scale=options.min_scale)
+        if len(tiles) > 1:
+            return edited, scale, tiles
+
+    return edited, scale, []
+
+def _base_render(png: bytes, edited: bytes, scale: float) -> BaseRender | None:
+    index = index_cards(edited)
+    view_box = read_view_box(edited)
+    if index is None or view_box is None:
+        return None
+    return BaseRender(png, index, view_box, scale)
+
+def render_bracket(svg: bytes, options: RenderOptions) -> tuple[bytes | None, list[bytes], float, BaseRender | None]:
+    """
+    Fit the Challonge SVG to its content, rasterize and encode it, all inside the worker.
+    The scale comes from the content size when `adaptive_scale` is on.
+    When the image would exceed `tile_max_pixels`, nothing is rasterized and the
+    tile documents are returned with the scale so they can be spread over the pool.
+    With `incremental`, the lossless raster is returned too so later renders can repaint it.
+    """
+    edited, scale, tiles = _prepare(svg, options)
+    if tiles:
+        return None, tiles, scale, None
+
+    png: bytes = render_png(edited, scale)
+    base: BaseRender | None = _base_render(png, edited, scale) if options.incremental else None
+
+    # Only the raster is needed from here on, free the document before the encoder decodes it
+    del edited
+    return encode_png(png, options), [], scale, base
+
+def render_incremental(svg: bytes, options: RenderOptions, base: BaseRender) -> tuple[bytes, BaseRender] | None:
+    """
+    Repaint the match cards that changed since `base` instead of the whole bracket.
+    Returns None when the layout moved, so the caller falls back to `render_bracket`.
+    """
+    edited, scale, tiles = _prepare(svg, options)
+    if tiles or scale != base.scale:
+        return None
+
+    index = index_cards(edited)
+    if index is None:
+        return None
+
+    png: bytes | None = repaint(base, edited, index, render_png)
+    del edited
+    if png is None:
+        return None
+
+    return encode_png(png, options), BaseRender(png, index, base.view_box, scale)
+
+def render_native(bracket: BracketData, options: RenderOptions) -> bytes:
+    """Lay out and draw a bracket from API data, then encode it (runs inside a worker)"""
+    with span("layout"):
+        layout = layout_bracket(bracket)
+
+    scale: float = options.scale
+    if options.adaptive_scale:
+        scale = pick_scale(layout.width + options.padding * 2, layout.height + options.padding * 1.5, options.min_scale, options.scale, options.target_pixels)
+
+    with span("draw"):
+        png: bytes = draw_bracket(bracket, layout, scale, options.padding)
+
+    return encode_png(png, options)
+
+class RenderEngine:
+    """
+    Rasterizes SVGs in a pool of warm worker processes so cairosvg's pure
+    Python work does not hold the event loop's GIL.
+    `workers=0` renders in a thread instead (CLI and tiny setups).
+    With an image cache, bracket renders are looked up before being queued.
+    With `tile_max_pixels`, brackets larger than that are cut into tiles
+    rasterized in parallel, which bounds the bitmap size of every job.
+    Output is re-encoded with a palette as PNG or WebP within a byte budget.
+    The last raster of each tournament is kept so small updates only repaint
+    the match cards that changed.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        timeout: float = 60,
+        max_queue: int = 32,
+        cache: ImageCache | None = None,
+        options: RenderOptions | None = None,
+        max_bases: int = 32
+    ):
+        self.workers: int = (os.cpu_count() or 1) if workers is None else workers
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.cache = cache
+        self.options: RenderOptions = options or RenderOptions()
+
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots = asyncio.Semaphore(max_queue)
+        self._queued: int = 0
+        self._capacity = asyncio.Condition()
+        self._flights = SingleFlight()
+
+        # Jobs handed to the pool, at most one per worker so the timeout only runs while a job does
+        self._running = asyncio.Semaphore(max(self.workers, 1))
+        self._in_flight: dict[ProcessPoolExecutor, set[asyncio.Future[Any]]] = {}
+        self._retiring: set[asyncio.Task[None]] = set()
+
+        # Last full-quality raster per tournament, least recently used first
+        self._bases: OrderedDict[str, BaseRender] = OrderedDict()
+        self.max_bases = max_bases
+
+    @property
+    def queued(self) -> int:
+        """Jobs currently waiting or running"""
+        return self._queued
+
+    def is_saturated(self) -> bool:
+        return self._queued >= self.max_queue
+
+    async def start(self) -> None:
+        """Create the pool and spawn every worker up front"""
+        if self.workers <= 0 or self._pool:
+            return
+
+        logger.info(f"Starting render pool with {self.workers} worker(s)")
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _warm) for _ in range(self.workers)))
+
+    async def close(self) -> None:
+        if self.cache:
+            await self.cache.flush()
+
+        # Terminated rather than shut down: a worker blocked sending a result nobody reads any more
+        # would otherwise keep the process from exiting
+        if self._pool:
+            self._terminate(self._pool)
+            self._pool = None
+
+        for task in self._retiring:
+            task.cancel()
+        await asyncio.gather(*self._retiring, return_exceptions=True)
+
+    def _restart_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Replace a broken pool (once, even if several jobs failed on it)"""
+        if pool is not self._pool:
+            return
+
+        self._in_flight.pop(pool, None)
+        self._terminate(pool)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+    def _retire_pool(self, pool: ProcessPoolExecutor, stuck: asyncio.Future[Any]) -> None:
+        """
+        Replace a pool holding a stuck job. New jobs go to a fresh pool right away,
+        the old one is only terminated once its other in-flight jobs have finished.
+        """
+        if pool is not self._pool:
+            return
+
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+        # Nobody awaits the stuck job any more, its failure on termination is expected
+        stuck.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+        others: set[asyncio.Future[Any]] = self._in_flight.pop(pool, set()) - {stuck}
+        task = asyncio.create_task(self._terminate_when_done(pool, others))
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    async def _terminate_when_done(self, pool: ProcessPoolExecutor, futures: set[asyncio.Future[Any]]) -> None:
+        try:
+            if futures:
+                await asyncio.wait(futures)
+        finally:
+            self._terminate(pool)
+
+    @staticmethod
+    def _terminate(pool: ProcessPoolExecutor) -> None:
+        if hasattr(pool, "terminate_workers"):
+            pool.terminate_workers() # Python 3.14+
+            return
+
+        # shutdown() alone leaves a stuck worker running, kill the processes first
+        for process in list((pool._processes or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def wait_for_capacity(self) -> None:
+        """Back-pressure hook: wait until the render queue has room"""
+        async with self._capacity:
+            await self._capacity.wait_for(lambda: not self.is_saturated())
+
+    async def _release(self) -> None:
+        self._queued -= 1
+        async with self._capacity:
+            self._capacity.notify_all()
+
+    async def run(self, func: Any, *args: Any, tournament: str | None = None) -> Any:
+        """
+        Run a picklable job in the pool with the queue limit and per-job timeout.
+        Jobs wait for a free worker first, the timeout only covers the job while it runs.
+        The stage spans recorded by the job are added to the bot metrics.
+        """
+        async with self._slots:
+            self._queued += 1
+            try:
+                async with self._running:
+                    return await self._run(func, *args, tournament=tournament)
+            finally:
+                await self._release()
+
+    async def _run(self, func: Any, *args: Any, tournament: str | None = None) -> Any:
+        if self.workers <= 0:
+            result, spans = await asyncio.wait_for(asyncio.to_thread(collect, func, *args), timeout=self.timeout)
+            metrics.record(spans, tournament)
+            return result
+
+        if self._pool is None:
+            await self.start()
+
+        pool: ProcessPoolExecutor = self._pool # type: ignore[assignment]
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[Any] = loop.run_in_executor(pool, collect, func, *args)
+
+        in_flight: set[asyncio.Future[Any]] = self._in_flight.setdefault(pool, set())
+        in_flight.add(future)
+        future.add_done_callback(in_flight.discard)
+
+        try:
+            # Shielded so a timeout leaves the job to the pool instead of cancelling it
+            result, spans = await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+            metrics.record(spans, tournament)
+            return result
+        except asyncio.TimeoutError:
+            logger.error(f"Render job timed out after {self.timeout}s, replacing its pool once the other jobs finish")
+            self._retire_pool(pool, future)
+            raise
+        except BrokenProcessPool:
+            logger.error("Render pool broke, restarting pool")
+            self._restart_pool(pool)
+            raise
+
+    async def render_bracket(self, svg: bytes, tournament_id: str | None = None, svg_hash: str | None = None) -> list[bytes]:
+        """
+        Edit, rasterize and encode a raw Challonge SVG off the event loop.
+        Returns one image, or one per tile for brackets over the tile budget.
+        Given the tournament and SVG hash, the result is served from / stored in the image cache,
+        and concurrent renders of the same content (same tournament in several channels) are shared.
+        """
+        if tournament_id and svg_hash:
+            return await self._flights.run((tournament_id, svg_hash), lambda: self._render_bracket(svg, tournament_id, svg_hash))
+        return await self._render_bracket(svg, tournament_id, svg_hash)
+
+    async def _render_bracket(self, svg: bytes, tournament_id: str | None, svg_hash: str | None) -> list[bytes]:
+        options: RenderOptions = self.options
+
+        key: str | None = None
+        if self.cache and tournament_id and svg_hash:
+            key = make_cache_key(tournament_id, svg_hash, *options.cache_params())
+            cached: list[bytes] | None = await self.cache.get(key)
+            if cached is not None:
+                logger.info(f"Image cache hit for {tournament_id}")
+                metrics.increment("image_cache_hits")
+                return cached
+            metrics.increment("image_cache_misses")
+
+        images: list[bytes] | None = None
+        base: BaseRender | None = self._bases.pop(tournament_id, None) if tournament_id else None
+
+        if base and options.incremental:
+            repainted: tuple[bytes, BaseRender] | None = await self.run(render_incremental, svg, options, base, tournament=tournament_id)
+            base = None
+            if repainted:
+                metrics.increment("incremental_renders")
+                image_bytes, base = repainted
+                images = [image_bytes]
+
+        if images is None:
+            image_bytes, tiles, scale, base = await self.run(render_bracket, svg, options, tournament=tournament_id)
+
+            if image_bytes is not None:
+                images = [image_bytes]
+            else:
+                logger.info(f"Rendering {len(tiles)} tiles in parallel at scale {scale}")
+                images = list(await asyncio.gather(*(self.run(render_tile, tile, scale, options, len(tiles), tournament=tournament_id) for tile in tiles)))
+
+        if tournament_id and base:
+            self._bases[tournament_id] = base
+            while len(self._bases) > self.max_bases:
+                self._bases.popitem(last=False)
+
+        if key and self.cache:
+            await self.cache.put(key, images)
+
+        return images
+
+    async def render_native(self, bracket: BracketData, tournament_id: str | None = None, content_hash: str | None = None) -> list[bytes]:
+        """
+        Draw a bracket from API match data in the pool, skipping the SVG and Cairo entirely.
+        Given the tournament and content hash, the result is served from / stored in the image cache.
+        """
+        if tournament_id and content_hash:
+            return await self._flights.run((tournament_id, content_hash), lambda: self._render_native(bracket, tournament_id, content_hash))
+        return await self._render_native(bracket, tournament_id, content_hash)
+
+    async def _render_native(self, bracket: BracketData, tournament_id: str | None, content_hash: str | None) -> list[bytes]:
+        options: RenderOptions = self.options
+
+        key: str | None = None
+        if self.cache and tournament_id and content_hash:
+            key = make_cache_key(tournament_id, content_hash, "native", *options.cache_params())
+            cached: list[bytes] | None = await self.cache.get(key)
+            if cached is not None:
+                logger.info(f"Image cache hit for {tournament_id}")
+                metrics.increment("image_cache_hits")
+                return cached
+            metrics.increment("image_cache_misses")
+
+        images: list[bytes] = [await self.run(render_native, bracket, options, tournament=tournament_id)]
+
+        if key and self.cache:
+            await self.cache.put(key, images)
+
+        return images
+
+def create_render_engine(
+    settings: Settings,
+    workers: int | None = None,
+    cache_directory: str = "cache/images",
+    cache_share: float = 1
+) -> RenderEngine:
+    """The render engine configured by the bot settings, with `cache_share` of the image cache budgets"""
+    return RenderEngine(
+        workers=workers,
+        timeout=settings.render_timeout_seconds,
+        max_queue=settings.render_queue_size,
+        options=RenderOptions(
+            scale=settings.render_max_scale,
+            min_scale=settings.render_min_scale,
+            target_pixels=settings.render_target_pixels,
+            tile_max_pixels=settings.render_tile_max_pixels or None,
+            image_format=settings.image_format,
+            colors=settings.image_colors,
+            max_bytes=int(settings.image_max_mb * 1024 * 1024) or None,
+            incremental=settings.render_incremental
+        ),
+        cache=ImageCache(
+            memory_bytes=int(settings.image_cache_memory_mb * 1024 * 1024 * cache_share),
+            disk_bytes=int(settings.image_cache_disk_mb * 1024 * 1024 * cache_share),
+            directory=cache_directory
+        )
+    )
@@ -0,0 +1,84 @@
+import os
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+def _flag(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes')
+
+@dataclass(frozen=True)
+class Settings:
+    """Bot configuration, read from the environment (and the .env file) by `load_settings`."""
+    discord_bot_token: str | None = None
+    challonge_api_key: str | None = None
+    challonge_url: str | None = None # challonge.com unless set, e.g. to a fake server for load tests
+    challonge_api_url: str | None = None
+    svg_max_mb: float = 16 # Largest bracket SVG downloaded, 0 for no limit
+    state_backend: str = 'json'
+    state_flush_seconds: float = 1
+    poll_interval_minutes: float = 15
+    poll_min_minutes: float = 1
+    poll_max_minutes: float = 30
+    max_concurrent_polls: int = 8
+    status_index_seconds: float = 30 # 0 polls every tournament on its own
+    status_index_days: int = 90
+    challonge_subdomains: tuple[str, ...] = ()
+    render_workers: int | None = None # Defaults to one per CPU core
+    render_timeout_seconds: float = 60
+    render_queue_size: int = 32
+    render_tile_max_pixels: int = 4096 * 4096 # 0 disables tiling
+    render_max_scale: float = 2
+    render_min_scale: float = 1
+    render_target_pixels: int = 8 * 1024 * 1024
+    render_incremental: bool = True
+    bracket_renderer: str = 'svg' # 'native' draws from the API match data
+    image_format: str = 'png'
+    image_colors: int = 128 # 0 keeps full colour
+    image_max_mb: float = 8
+    image_cache_memory_mb: int = 64
+    image_cache_disk_mb: int = 512
+    delivery_concurrency: int = 8
+    delivery_channel_interval: float = 1
+    metrics_port: int = 0 # 0 disables the Prometheus endpoint
+    shard_workers: int = 0 # Poll and render in this many processes, 0 keeps everything in the bot process
+    startup_budget_seconds: float = 15 # Process start to gateway ready
+
+def load_settings(env_file: str | None = None) -> Settings:
+    """Load the .env file into the environment and read the settings from it"""
+    load_dotenv(env_file)
+
+    return Settings(
+        discord_bot_token=os.getenv('DISCORD_BOT_TOKEN'),
+        challonge_api_key=os.getenv('CHALLONGE_API_KEY'),
+        challonge_url=os.getenv('CHALLONGE_URL'),
+        challonge_api_url=os.getenv('CHALLONGE_API_URL'),
+        svg_max_mb=float(os.getenv('SVG_MAX_MB', 16)),
+        state_backend=os.getenv('STATE_BACKEND', 'json'),
+        state_flush_seconds=float(os.getenv('STATE_FLUSH_SECONDS', 1)),
+        poll_interval_minutes=float(os.getenv('POLL_INTERVAL_MINUTES', 15)),
+        poll_min_minutes=float(os.getenv('POLL_MIN_MINUTES', 1)),
+        poll_max_minutes=float(os.getenv('POLL_MAX_MINUTES', 30)),
+        max_concurrent_polls=int(os.getenv('MAX_CONCURRENT_POLLS', 8)),
+        status_index_seconds=float(os.getenv('STATUS_INDEX_SECONDS', 30)),
+        status_index_days=int(os.getenv('STATUS_INDEX_DAYS', 90)),
+        challonge_subdomains=tuple(s.strip() for s in os.getenv('CHALLONGE_SUBDOMAINS', '').split(',') if s.strip()),
+        render_workers=int(os.environ['RENDER_WORKERS']) if os.getenv('RENDER_WORKERS') else None,
+        render_timeout_seconds=float(os.getenv('RENDER_TIMEOUT_SECONDS', 60)),
+        render_queue_size=int(os.getenv('RENDER_QUEUE_SIZE', 32)),
+        render_tile_max_pixels=int(os.getenv('RENDER_TILE_MAX_PIXELS', 4096 * 4096)),
+        render_max_scale=float(os.getenv('RENDER_MAX_SCALE', 2)),
+        render_min_scale=float(os.getenv('RENDER_MIN_SCALE', 1)),
+        render_target_pixels=int(os.getenv('RENDER_TARGET_PIXELS', 8 * 1024 * 1024)),
+        render_incremental=_flag(os.getenv('RENDER_INCREMENTAL', 'true')),
+        bracket_renderer=os.getenv('BRACKET_RENDERER', 'svg'),
+        image_format=os.getenv('IMAGE_FORMAT', 'png'),
+        image_colors=int(os.getenv('IMAGE_COLORS', 128)),
+        image_max_mb=float(os.getenv('IMAGE_MAX_MB', 8)),
+        image_cache_memory_mb=int(os.getenv('IMAGE_CACHE_MEMORY_MB', 64)),
+        image_cache_disk_mb=int(os.getenv('IMAGE_CACHE_DISK_MB', 512)),
+        delivery_concurrency=int(os.getenv('DELIVERY_CONCURRENCY', 8)),
+        delivery_channel_interval=float(os.getenv('DELIVERY_CHANNEL_INTERVAL', 1)),
+        metrics_port=int(os.getenv('METRICS_PORT', 0)),
+        shard_workers=int(os.getenv('SHARD_WORKERS', 0)),
+        startup_budget_seconds=float(os.getenv('STARTUP_BUDGET_SECONDS', 15))
+    )
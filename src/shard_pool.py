@@ -0,0 +1,458 @@
+import asyncio
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import queue
+import time
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from typing import Any
+import logging
+
+from bracket_drawer import BracketUpdate, get_latest_bracket
+from challonge_client import create_client
+from metrics import metrics, span
+from poll_scheduler import AdaptiveInterval, PollOutcome, PollScheduler
+from render_engine import create_render_engine
+from settings import Settings
+from single_flight import SingleFlight
+from state_store import init_store
+from status_poller import StatusPoller, create_status_poller
+from tournament_registry import TrackedTournament
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+# Update callback: (registry key, update fetched by a worker)
+UpdateCallback = Callable[[str, BracketUpdate], Awaitable[Any]]
+LookupCallback = Callable[[str], TrackedTournament | None]
+
+class HashRing:
+    """Consistent hashing of keys onto nodes, so adding or removing a node only moves that node's keys."""
+
+    def __init__(self, replicas: int = 64):
+        self.replicas = replicas
+        self._points: list[int] = []
+        self._owners: dict[int, int] = {}
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    @property
+    def nodes(self) -> set[int]:
+        return set(self._owners.values())
+
+    def add(self, node: int) -> None:
+        for replica in range(self.replicas):
+            point: int = self._hash(f"{node}:{replica}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node: int) -> None:
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def node_for(self, key: str) -> int | None:
+        """The node owning a key: the first point clockwise from the key's hash"""
+        if not self._points:
+            return None
+        index: int = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+def shard_state_path(settings: Settings, index: int) -> str:
+    """State file of a worker (resolved tournament IDs), apart from the bot's"""
+    return f"data.shard-{index}.sqlite3" if settings.state_backend == "sqlite" else f"data.shard-{index}.json"
+
+def _next_command(commands: Queue) -> tuple[Any, ...]:
+    """Next command from the bot, or a stop once the bot is gone (workers are not daemonic)"""
+    parent: BaseProcess | None = multiprocessing.parent_process()
+    while True:
+        try:
+            return commands.get(timeout=1)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                return ("stop",)
+
+async def _serve(index: int, settings: Settings, commands: Queue, results: Connection) -> None:
+    """Poll and render the brackets of one shard until told to stop"""
+    metrics.forward()
+    store = init_store(settings.state_backend, settings.state_flush_seconds, path=shard_state_path(settings, index))
+    client = create_client(settings)
+    statuses: StatusPoller | None = create_status_poller(settings, client)
+
+    # The shards are the parallelism: each renders on its own thread unless RENDER_WORKERS asks for a pool
+    engine = create_render_engine(
+        settings,
+        workers=settings.render_workers or 0,
+        cache_directory=f"cache/images/shard-{index}",
+        cache_share=1 / settings.shard_workers
+    )
+
+    tracked: dict[str, TrackedTournament] = {}
+    flights = SingleFlight()
+
+    async def fetch(key: str) -> BracketUpdate | None:
+        bracket: TrackedTournament | None = tracked.get(key)
+        if not bracket:
+            return None
+
+        with span("refresh", bracket.tournament_id):
+            return await get_latest_bracket(
+                client, engine, bracket, native=settings.bracket_renderer == 'native', statuses=statuses
+            )
+
+    async def refresh(key: str, request_id: int | None = None) -> PollOutcome | None:
+        try:
+            update: BracketUpdate | None = await flights.run(key, lambda: fetch(key))
+        except Exception as e:
+            logger.error(f"Failed to refresh {key}: {e}")
+            update = BracketUpdate(error=True)
+
+        if update is None:
+            scheduler.untrack(key)
+            return None
+
+        results.send(("update", index, key, request_id, update, *metrics.drain()))
+
+        if update.is_complete or key not in scheduler:
+            # The bot stops tracking finished brackets, one-off refreshes are not kept
+            scheduler.untrack(key)
+            tracked.pop(key, None)
+
+        if update.images:
+            return PollOutcome.CHANGED
+        if update.error:
+            return PollOutcome.ERROR
+        return PollOutcome.UNCHANGED
+
+    scheduler = PollScheduler(
+        refresh,
+        interval=settings.poll_interval_minutes * 60,
+        max_concurrency=settings.max_concurrent_polls,
+        backpressure=engine.wait_for_capacity,
+        policy=AdaptiveInterval(
+            initial=settings.poll_interval_minutes * 60,
+            floor=settings.poll_min_minutes * 60,
+            ceiling=settings.poll_max_minutes * 60
+        )
+    )
+    refreshes: set[asyncio.Task[Any]] = set()
+
+    await engine.start()
+    scheduler.start()
+    logger.info(f"Shard worker {index} ready")
+
+    try:
+        while True:
+            command: tuple[Any, ...] = await asyncio.to_thread(_next_command, commands)
+            action: str = command[0]
+
+            if action == "stop":
+                break
+            elif action == "track":
+                bracket: TrackedTournament = command[1]
+                tracked[bracket.key] = bracket
+                if command[2] is not None or bracket.key not in scheduler:
+                    scheduler.track(bracket.key, delay=command[2])
+            elif action == "sync":
+                # A delivered or unchanged update, committed by the bot
+                if command[1].key in tracked:
+                    tracked[command[1].key] = command[1]
+            elif action == "untrack":
+                scheduler.untrack(command[1])
+                tracked.pop(command[1], None)
+            elif action == "trigger":
+                scheduler.trigger(command[1])
+            elif action == "refresh":
+                bracket = command[1]
+                tracked[bracket.key] = bracket
+                task = asyncio.create_task(refresh(bracket.key, command[2]))
+                refreshes.add(task)
+                task.add_done_callback(refreshes.discard)
+    finally:
+        await scheduler.stop()
+        await client.close()
+        await engine.close()
+        await store.close()
+
+def _worker_main(index: int, settings: Settings, commands: Queue, results: Connection) -> None:
+    """Entry point of a shard worker process"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s %(levelname)-8s shard-{index} %(name)-15s %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    # A render pool must not fork this process: its threads and its end of the result pipe would be copied
+    multiprocessing.set_start_method("spawn", force=True)
+
+    try:
+        asyncio.run(_serve(index, settings, commands, results))
+    except KeyboardInterrupt:
+        pass
+
+@dataclass
+class ShardWorker:
+    """Handle on one worker process, its command queue and the pipe it sends results on."""
+    index: int
+    process: BaseProcess
+    commands: Queue
+    results: Connection
+    started_at: float
+    reader: asyncio.Task[None] | None = None
+
+class ShardPool:
+    """
+    Polling and rendering spread over `workers` processes, so capacity grows with cores
+    instead of being capped by the bot's event loop. Tracked brackets are assigned to
+    workers by consistent hashing of their tournament, so channels tracking the same
+    tournament share a worker's cache and single-flight. Each worker runs its own scheduler,
+    Challonge client and render engine, and sends every update back to the bot,
+    which delivers and commits it.
+    A worker that dies has its brackets reassigned to the others until it is restarted.
+    Every worker has its own result pipe, so one killed mid-send cannot stall the others.
+    Drop-in for the bot's `PollScheduler` (`track`, `untrack`, `trigger`, `start`, `stop`).
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        lookup: LookupCallback,
+        on_update: UpdateCallback,
+        check_interval: float = 1,
+        restart_delay: float = 1,
+        max_restart_delay: float = 60,
+        timeout: float = 120
+    ):
+        self.settings = settings
+        self.workers: int = settings.shard_workers
+        self.interval: float = settings.poll_interval_minutes * 60
+        self.lookup = lookup
+        self.on_update = on_update
+        self.check_interval = check_interval
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.timeout = timeout
+
+        # Spawned, not forked: the workers must not inherit the gateway connection or its threads.
+        # Not daemonic either, so they can run a render pool of their own; `stop` joins them.
+        self._context = multiprocessing.get_context("spawn")
+        self._ring = HashRing()
+        self._workers: dict[int, ShardWorker] = {}
+        self._restarts: dict[int, tuple[float, float]] = {} # index -> (restart at, next delay)
+
+        self._assigned: dict[str, int | None] = {} # key -> worker index
+        self._requests: dict[int, tuple[int, asyncio.Future[BracketUpdate]]] = {}
+        self._request_ids = itertools.count(1)
+        self._tasks: list[asyncio.Task[None]] = []
+        self._handlers: set[asyncio.Task[Any]] = set()
+
+        # Result readers block on their pipe for as long as a worker lives, so they get threads of their own
+        # instead of starving the default executor (state flushes, image cache IO...). Twice the workers
+        # leaves room for the reader of a restarted worker while the old one winds down.
+        self._readers: ThreadPoolExecutor | None = None
+
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        if self.is_running():
+            return
+
+        logger.info(f"Starting {self.workers} shard worker(s)")
+        self._readers = ThreadPoolExecutor(max_workers=self.workers * 2, thread_name_prefix="shard-results")
+        for index in range(self.workers):
+            self._spawn(index)
+        self._rebalance()
+
+        self._tasks = [asyncio.create_task(self._monitor(), name="shard-monitor")]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for worker in self._workers.values():
+            worker.commands.put(("stop",))
+        for worker in self._workers.values():
+            await asyncio.to_thread(worker.process.join, 10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                await asyncio.to_thread(worker.process.join, 5)
+            # The reader ends and closes the pipe once the worker is gone
+            if worker.reader:
+                await asyncio.gather(worker.reader, return_exceptions=True)
+        self._workers.clear()
+
+        if self._readers:
+            self._readers.shutdown(wait=False)
+            self._readers = None
+
+        for _, future in self._requests.values():
+            if not future.done():
+                future.cancel()
+
+    def _spawn(self, index: int) -> None:
+        commands: Queue = self._context.Queue()
+        results, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self.settings, commands, sender),
+            name=f"shard-{index}"
+        )
+        process.start()
+        # Only the worker keeps the sending end, so its exit shows up as the end of the pipe
+        sender.close()
+
+        worker = ShardWorker(index, process, commands, results, time.monotonic())
+        worker.reader = asyncio.create_task(self._read_results(worker), name=f"shard-{index}-results")
+        self._workers[index] = worker
+        self._ring.add(index)
+
+    def _send(self, index: int | None, command: tuple[Any, ...]) -> None:
+        worker: ShardWorker | None = self._workers.get(index) if index is not None else None
+        if worker:
+            worker.commands.put(command)
+
+    def _rebalance(self) -> None:
+        """Move every bracket whose owner changed with the set of live workers"""
+        moved: int = 0
+        for key, current in list(self._assigned.items()):
+            owner: int | None = self._owner(key)
+            if owner == current:
+                continue
+
+            self._send(current, ("untrack", key))
+            tracked: TrackedTournament | None = self.lookup(key)
+            if tracked and owner is not None:
+                self._send(owner, ("track", tracked, None))
+            self._assigned[key] = owner
+            moved += 1
+
+        if moved:
+            logger.info(f"Reassigned {moved} bracket(s) across {len(self._ring.nodes)} shard worker(s)")
+
+    def _owner(self, key: str) -> int | None:
+        """The worker of a bracket, from its tournament (the last part of the guild:channel:tournament key)"""
+        return self._ring.node_for(key.split(":", 2)[-1])
+
+    def track(self, key: str, delay: float | None = None) -> None:
+        """Hand a bracket to its worker; its current state travels with it"""
+        tracked: TrackedTournament | None = self.lookup(key)
+        if not tracked:
+            return
+
+        owner: int | None = self._owner(key)
+        self._assigned[key] = owner
+        self._send(owner, ("track", tracked, delay))
+
+    def untrack(self, key: str) -> None:
+        self._send(self._assigned.pop(key, None), ("untrack", key))
+
+    def trigger(self, key: str) -> None:
+        self._send(self._assigned.get(key), ("trigger", key))
+
+    def sync(self, tracked: TrackedTournament) -> None:
+        """Send a committed bracket back to its worker, so the next poll compares against it"""
+        self._send(self._assigned.get(tracked.key), ("sync", tracked))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._assigned
+
+    async def refresh(self, tracked: TrackedTournament) -> BracketUpdate:
+        """Refresh a bracket now on its worker and wait for the update"""
+        owner: int | None = self._assigned.get(tracked.key, self._owner(tracked.key))
+        if owner is None or owner not in self._workers:
+            raise RuntimeError("No shard worker is running")
+
+        request_id: int = next(self._request_ids)
+        future: asyncio.Future[BracketUpdate] = asyncio.get_running_loop().create_future()
+        self._requests[request_id] = (owner, future)
+        self._send(owner, ("refresh", tracked, request_id))
+
+        try:
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        finally:
+            self._requests.pop(request_id, None)
+
+    def _receive(self, worker: ShardWorker) -> tuple[Any, ...] | None:
+        """Next message of a worker, or None once it has exited and its pipe is drained"""
+        while not worker.results.poll(self.check_interval):
+            if not worker.process.is_alive():
+                return None
+        return worker.results.recv()
+
+    async def _read_results(self, worker: ShardWorker) -> None:
+        """Handle the updates of one worker until it exits, then drop its pipe"""
+        try:
+            while True:
+                message: tuple[Any, ...] | None = await asyncio.get_running_loop().run_in_executor(
+                    self._readers, self._receive, worker
+                )
+                if message is None:
+                    return
+                self._handle_result(message)
+        except EOFError:
+            pass
+        except Exception as e:
+            # A worker killed mid-send leaves a truncated message, only its own pipe is lost
+            logger.error(f"Lost the result pipe of shard worker {worker.index}: {e!r}")
+        finally:
+            worker.results.close()
+
+    def _handle_result(self, message: tuple[Any, ...]) -> None:
+        _, index, key, request_id, update, observations, counters = message
+        metrics.merge(observations, counters)
+
+        if request_id is not None:
+            request: tuple[int, asyncio.Future[BracketUpdate]] | None = self._requests.get(request_id)
+            if request and not request[1].done():
+                request[1].set_result(update)
+            return
+
+        if self._assigned.get(key) != index:
+            # Polled just before the bracket moved to another worker
+            return
+
+        task = asyncio.create_task(self.on_update(key, update))
+        self._handlers.add(task)
+        task.add_done_callback(self._handlers.discard)
+
+    async def _monitor(self) -> None:
+        """Reassign the brackets of dead workers, and restart them with a growing delay"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            now: float = time.monotonic()
+
+            for index, worker in list(self._workers.items()):
+                if worker.process.is_alive():
+                    continue
+
+                logger.error(f"Shard worker {index} exited with code {worker.process.exitcode}, reassigning its brackets")
+                del self._workers[index]
+                self._ring.remove(index)
+                self._rebalance()
+
+                for request_id, (owner, future) in list(self._requests.items()):
+                    if owner == index and not future.done():
+                        future.set_exception(RuntimeError(f"Shard worker {index} died"))
+
+                # Quick crashes double the delay before the next restart
+                delay: float = self.restart_delay
+                if index in self._restarts and now - worker.started_at < self.max_restart_delay:
+                    delay = min(self._restarts[index][1] * 2, self.max_restart_delay)
+                self._restarts[index] = (now + delay, delay)
+
+            for index, (restart_at, delay) in list(self._restarts.items()):
+                if index not in self._workers and now >= restart_at:
+                    logger.info(f"Restarting shard worker {index}")
+                    self._spawn(index)
+                    self._rebalance()
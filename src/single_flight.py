@@ -0,0 +1,37 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, TypeVar
+import logging
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """
+    At most one call in progress per key.
+    Callers arriving while a call runs await the same result instead of starting another;
+    the next call after it finishes starts fresh.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future[Any]] = {}
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        future: asyncio.Future[Any] | None = self._calls.get(key)
+
+        if future is None or future.done():
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+
+            def forget(done: asyncio.Future[Any]) -> None:
+                if self._calls.get(key) is done:
+                    del self._calls[key]
+
+            future.add_done_callback(forget)
+        else:
+            logger.debug(f"Joining the call already in progress for {key}")
+
+        # A cancelled caller must not cancel the call the others are waiting on
+        return await asyncio.shield(future)
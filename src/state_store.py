@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import sqlite3
+from typing import Any
+import logging
+
+from metrics import span
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+# State files for the bot
+DATA_JSON: str = "data.json"
+DATA_SQLITE: str = "data.sqlite3"
+
+# Dirty entries are (section, key); section is None for top-level values
+DirtyKey = tuple[str | None, str]
+
+class JsonBackend:
+    """Whole document in one JSON file, replaced atomically through a temp file."""
+
+    def __init__(self, path: str = DATA_JSON):
+        self.path = path
+
+    def load(self) -> dict[str, Any]:
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                return json.load(f)
+        return {}
+
+    def prepare(self, data: dict[str, Any], dirty: set[DirtyKey]) -> Any:
+        """Snapshot taken on the event loop so the write sees a consistent state"""
+        return json.dumps(data, separators=(",", ":"))
+
+    def write(self, snapshot: str) -> None:
+        temp_path: str = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(snapshot)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def close(self) -> None:
+        pass
+
+class SqliteBackend:
+    """One row per key, so a flush only writes what changed."""
+
+    def __init__(self, path: str = DATA_SQLITE):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (section TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (section, key))"
+        )
+        self._conn.commit()
+
+    def load(self) -> dict[str, Any]:
+        data: dict[str, Any] = {}
+        rows = self._conn.execute("SELECT section, key, value FROM state ORDER BY section").fetchall()
+
+        for section, key, value in rows:
+            if section == "":
+                data[key] = json.loads(value)
+            else:
+                data.setdefault(section, {})[key] = json.loads(value)
+
+        return data
+
+    def prepare(self, data: dict[str, Any], dirty: set[DirtyKey]) -> Any:
+        """Rows to upsert and delete for the dirty keys"""
+        upserts: list[tuple[str, str, str]] = []
+        deletes: list[tuple[str, str]] = []
+
+        for section, key in dirty:
+            container: Any = data if section is None else data.get(section, {})
+            if key in container:
+                upserts.append((section or "", key, json.dumps(container[key], separators=(",", ":"))))
+            else:
+                deletes.append((section or "", key))
+
+        return upserts, deletes
+
+    def write(self, snapshot: tuple[list[tuple[str, str, str]], list[tuple[str, str]]]) -> None:
+        upserts, deletes = snapshot
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO state (section, key, value) VALUES (?, ?, ?)", upserts)
+            self._conn.executemany("DELETE FROM state WHERE section = ? AND key = ?", deletes)
+
+    def close(self) -> None:
+        self._conn.close()
+
+class StateStore:
+    """
+    In-memory source of truth for the bot state with write-behind persistence.
+    Changes mark keys dirty and are written together after `flush_delay` seconds.
+    Sections are dicts updated item by item with `set_item` / `delete_item`.
+    """
+
+    def __init__(self, backend: JsonBackend | SqliteBackend, flush_delay: float = 1.0):
+        self.backend = backend
+        self.flush_delay = flush_delay
+
+        self._data: dict[str, Any] = backend.load()
+        self._dirty: set[DirtyKey] = set()
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flush_lock = asyncio.Lock()
+
+    # Top-level values
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._data.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = value
+        self._mark_dirty(None, key)
+
+    def delete(self, key: str) -> None:
+        if key in self._data:
+            del self._data[key]
+            self._mark_dirty(None, key)
+
+    # Section items
+    def section(self, section: str) -> dict[str, Any]:
+        """Copy of a whole section"""
+        return dict(self._data.get(section, {}))
+
+    def get_item(self, section: str, key: str, default: Any = None) -> Any:
+        return self._data.get(section, {}).get(key, default)
+
+    def set_item(self, section: str, key: str, value: Any) -> None:
+        self._data.setdefault(section, {})[key] = value
+        self._mark_dirty(section, key)
+
+    def delete_item(self, section: str, key: str) -> None:
+        items: dict[str, Any] = self._data.get(section, {})
+        if key in items:
+            del items[key]
+            self._mark_dirty(section, key)
+
+    def _mark_dirty(self, section: str | None, key: str) -> None:
+        self._dirty.add((section, key))
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop yet (startup), write straight away
+            self.flush_sync()
+            return
+
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_delay, lambda: asyncio.ensure_future(self.flush()))
+
+    def _take_snapshot(self) -> Any:
+        dirty: set[DirtyKey] = self._dirty
+        self._dirty = set()
+        self._flush_handle = None
+        return self.backend.prepare(self._data, dirty)
+
+    async def flush(self) -> None:
+        """Write every pending change in one batch"""
+        async with self._flush_lock:
+            if not self._dirty:
+                self._flush_handle = None
+                return
+
+            snapshot: Any = self._take_snapshot()
+
+            try:
+                with span("state_save"):
+                    await asyncio.to_thread(self.backend.write, snapshot)
+            except Exception as e:
+                logger.error(f"Failed to persist state: {e}")
+
+    def flush_sync(self) -> None:
+        """Blocking flush for startup and shutdown"""
+        if self._flush_handle:
+            self._flush_handle.cancel()
+
+        if self._dirty:
+            self.backend.write(self._take_snapshot())
+
+    async def close(self) -> None:
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        await self.flush()
+        self.backend.close()
+
+_store: StateStore | None = None
+
+def init_store(backend: str = "json", flush_delay: float = 1.0, path: str | None = None) -> StateStore:
+    """Create the shared state store, in the default state file unless `path` is given"""
+    global _store
+    if backend == "sqlite":
+        _store = StateStore(SqliteBackend(path or DATA_SQLITE), flush_delay)
+    else:
+        _store = StateStore(JsonBackend(path or DATA_JSON), flush_delay)
+    return _store
+
+def get_store() -> StateStore:
+    """The shared state store, created with the defaults on first use"""
+    if _store is None:
+        return init_store()
+    return _store
@@ -0,0 +1,125 @@
+import time
+from datetime import date, timedelta
+from typing import Any
+import logging
+
+from challonge_client import ChallongeClient
+from metrics import metrics, span
+from settings import Settings
+from single_flight import SingleFlight
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+# Longest wait between attempts while the index keeps failing, in seconds
+MAX_RETRY_DELAY: float = 600
+
+class StatusPoller:
+    """
+    Status (`updated_at`, `state`) of every tournament the API key can list,
+    from the tournaments index in one request per scope instead of one per tournament.
+    The index is shared by all the brackets polled within `max_age` seconds.
+    Tournaments outside its scope (other accounts, older than `created_within_days`,
+    unlisted subdomains) are not found, and the caller falls back to the per-tournament call.
+    While the index cannot be fetched nothing is found either, and it is retried with backoff.
+    """
+
+    def __init__(
+        self,
+        client: ChallongeClient,
+        max_age: float = 30,
+        created_within_days: int = 90,
+        subdomains: tuple[str, ...] = ()
+    ):
+        self.client = client
+        self.max_age = max_age
+        self.created_within_days = created_within_days
+        self.subdomains = subdomains
+
+        self._index: dict[str, dict[str, Any]] = {}
+        self._fetched_at: float | None = None
+        self._failures: int = 0
+        self._retry_at: float = 0
+        self._flights = SingleFlight()
+
+    def _is_fresh(self) -> bool:
+        return self._fetched_at is not None and time.monotonic() - self._fetched_at < self.max_age
+
+    async def _fetch_scope(self, subdomain: str | None) -> list[dict[str, Any]]:
+        params: dict[str, Any] = {
+            "api_key": self.client.api_key,
+            "state": "all",
+            "created_after": (date.today() - timedelta(days=self.created_within_days)).isoformat()
+        }
+        if subdomain:
+            params["subdomain"] = subdomain
+
+        async with self.client.get(f"{self.client.api_url}tournaments.json", warm=False, params=params) as response:
+            response.raise_for_status()
+            data: list[dict[str, Any]] = await response.json()
+
+        return [entry.get("tournament", entry) for entry in data]
+
+    async def _refresh(self) -> None:
+        index: dict[str, dict[str, Any]] = {}
+        bare_slugs: dict[str, dict[str, Any]] = {}
+
+        try:
+            with span("status_index"):
+                for subdomain in (None, *self.subdomains):
+                    for tournament in await self._fetch_scope(subdomain):
+                        index[str(tournament["id"])] = tournament
+
+                        # Public slugs: `url` alone is only unique outside subdomains
+                        if tournament.get("subdomain"):
+                            index[f"{tournament['subdomain']}-{tournament['url']}"] = tournament
+                            # Links to sub.challonge.com/url give the bare slug, unless a public tournament uses it
+                            bare_slugs.setdefault(tournament["url"], tournament)
+                        else:
+                            index[tournament["url"]] = tournament
+        except Exception as e:
+            # Stale statuses would hide updates: drop the index so callers fall back, and back off
+            self._failures += 1
+            delay: float = min(self.max_age * 2 ** (self._failures - 1), MAX_RETRY_DELAY)
+            logger.error(f"Error fetching the tournament index, retrying in {delay:.0f}s: {e}")
+            self._index = {}
+            self._fetched_at = None
+            self._retry_at = time.monotonic() + delay
+            return
+
+        for slug, tournament in bare_slugs.items():
+            index.setdefault(slug, tournament)
+
+        logger.info(f"Tournament index lists {len({t['id'] for t in index.values()})} tournament(s)")
+        self._index = index
+        self._fetched_at = time.monotonic()
+        self._failures = 0
+
+    async def lookup(self, *keys: str | None) -> dict[str, Any] | None:
+        """The tournament listed under any of the keys (internal ID or public slug), or None when out of scope or unavailable"""
+        if not self._is_fresh() and time.monotonic() >= self._retry_at:
+            await self._flights.run("index", self._refresh)
+
+        if not self._is_fresh():
+            metrics.increment("status_index_unavailable")
+            return None
+
+        for key in keys:
+            if key and key in self._index:
+                metrics.increment("status_index_hits")
+                return self._index[key]
+
+        metrics.increment("status_index_misses")
+        return None
+
+def create_status_poller(settings: Settings, client: ChallongeClient) -> StatusPoller | None:
+    """The status index configured by the bot settings, or None when it is off or there is no API key"""
+    if not (client.api_key and settings.status_index_seconds):
+        return None
+
+    return StatusPoller(
+        client,
+        max_age=settings.status_index_seconds,
+        created_within_days=settings.status_index_days,
+        subdomains=settings.challonge_subdomains
+    )
@@ -0,0 +1,149 @@
+import math
+import re
+import logging
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+HEADER_OFFSET = 110 # Challonge header
+MATCH_CARD_HEIGHT = 55 # Height of one bracket node
+MATCH_CARD_WIDTH = 220 # Width of one bracket node
+
+# Regex to pull coordinates from strings
+TRANSLATE_PATTERN = re.compile(rb"translate\(\s*([\d.]+)[ ,]+([\d.]+)\s*\)")
+
+# transform="..." attributes anywhere in the document
+TRANSFORM_ATTR_PATTERN = re.compile(rb"""\stransform\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+
+# The root <svg ...> start tag and its attributes
+ROOT_TAG_PATTERN = re.compile(rb"<svg\b[^>]*?(/?)>", re.IGNORECASE)
+ATTR_PATTERN = re.compile(rb"""([\w:.-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+
+def scan_bounds(content: bytes) -> tuple[float, float, bool]:
+    """Single pass over the raw bytes for the furthest `translate(x, y)` offsets"""
+    max_x: float = 0
+    max_y: float = 0
+    is_found: bool = False
+
+    for attr in TRANSFORM_ATTR_PATTERN.finditer(content):
+        transform: bytes = attr.group(1) if attr.group(1) is not None else attr.group(2)
+        match = TRANSLATE_PATTERN.search(transform)
+        if match:
+            x = float(match.group(1))
+            y = float(match.group(2))
+
+            if x > max_x: max_x = x
+            if y > max_y: max_y = y
+            is_found = True
+
+    return max_x, max_y, is_found
+
+def root_attributes(root_tag: bytes) -> dict[bytes, bytes]:
+    """Attributes of the root start tag"""
+    return {m.group(1): (m.group(2) if m.group(2) is not None else m.group(3)) for m in ATTR_PATTERN.finditer(root_tag)}
+
+def build_root_tag(attrs: dict[bytes, bytes]) -> bytes:
+    """Serialize root attributes back into an <svg> start tag"""
+    return b"<svg " + b" ".join(k + b'="' + v.replace(b'"', b"&quot;") + b'"' for k, v in attrs.items()) + b">"
+
+def content_size(content: bytes) -> tuple[float, float]:
+    """Width and height of the bracket content, before padding"""
+    max_x, max_y, is_found = scan_bounds(content)
+
+    if is_found:
+        # Content Height = Header + Lowest Match Y + Match Height
+        # Content Width = Furthest Match X + Match Width
+        return max_x + MATCH_CARD_WIDTH, HEADER_OFFSET + max_y + MATCH_CARD_HEIGHT
+
+    # Fallback if parsing fails
+    root = ROOT_TAG_PATTERN.search(content)
+    attrs: dict[bytes, bytes] = root_attributes(root.group(0)) if root else {}
+    return float(attrs.get(b'width', 800)), float(attrs.get(b'height', 600))
+
+def fit_svg(content: bytes, padding: int = 40) -> tuple[bytes, float, float]:
+    """
+    Resize the svg from the website to its content and add a white background.
+    Only the root start tag is rewritten; the rest of the document is copied as is.
+    Returns the edited document with its final width and height.
+    """
+    root = ROOT_TAG_PATTERN.search(content)
+    if not root or root.group(1):
+        raise ValueError("SVG has no root element with content")
+
+    content_width, content_height = content_size(content)
+
+    # Add padding
+    final_width: float = content_width + (padding * 2)
+    final_height: float = content_height + (padding * 1.5)
+
+    # Update root attributes, keeping the others in place
+    attrs: dict[bytes, bytes] = root_attributes(root.group(0))
+    attrs[b'width'] = str(final_width).encode()
+    attrs[b'height'] = str(final_height).encode()
+    attrs[b'viewBox'] = f"-{padding} -{padding} {final_width} {final_height}".encode()
+    root_tag: bytes = build_root_tag(attrs)
+
+    # White background, first child so it is drawn behind everything
+    bg_rect: bytes = (
+        f'<rect x="-{padding}" y="-{padding}" width="{final_width}" height="{final_height}" fill="white" />'
+    ).encode()
+
+    return b"".join((content[:root.start()], root_tag, bg_rect, content[root.end():])), final_width, final_height
+
+def edit_svg(content: bytes, padding: int = 40) -> bytes:
+    """Resize the svg from the website to its content and add a white background"""
+    return fit_svg(content, padding)[0]
+
+def set_root_viewport(content: bytes, root: re.Match[bytes], x: float, y: float, width: float, height: float) -> bytes:
+    """Copy of the document with the root viewport moved to the given region"""
+    attrs: dict[bytes, bytes] = root_attributes(root.group(0))
+    attrs[b'width'] = str(width).encode()
+    attrs[b'height'] = str(height).encode()
+    attrs[b'viewBox'] = f"{x} {y} {width} {height}".encode()
+    root_tag: bytes = build_root_tag(attrs)
+
+    return b"".join((content[:root.start()], root_tag, content[root.end():]))
+
+def tile_svg(edited: bytes, scale: float, max_pixels: int, max_tiles: int = 10, min_scale: float | None = None) -> tuple[list[bytes], float]:
+    """
+    Split an edited SVG into a grid of viewBox regions of at most `max_pixels` each
+    once rasterized, and return them with the scale to rasterize them at.
+    Returns the document itself when it already fits.
+    Tiles never grow past the pixel budget: when more than `max_tiles` would be needed
+    the scale is lowered until they fit, below `min_scale` (with a warning) if need be.
+    """
+    root = ROOT_TAG_PATTERN.search(edited)
+    if not root:
+        raise ValueError("SVG has no root element")
+
+    view_box: bytes | None = root_attributes(root.group(0)).get(b'viewBox')
+    if not view_box:
+        return [edited], scale
+
+    x, y, width, height = (float(v) for v in view_box.replace(b",", b" ").split())
+    if width * height * scale * scale <= max_pixels:
+        return [edited], scale
+
+    def grid(scale: float) -> tuple[int, int]:
+        # Square tiles of the pixel budget, in SVG units
+        side: float = math.sqrt(max_pixels) / scale
+        return math.ceil(width / side), math.ceil(height / side)
+
+    columns, rows = grid(scale)
+    while columns * rows > max_tiles:
+        scale *= 0.9
+        columns, rows = grid(scale)
+
+    # Blurrier, but shown, and the memory of each tile stays bounded
+    if min_scale is not None and scale < min_scale:
+        logger.warning(f"Bracket only fits in {max_tiles} tiles at scale {scale:.2f}, below the minimum of {min_scale}")
+
+    # Spread the content evenly instead of leaving a thin last row/column
+    tile_width: float = width / columns
+    tile_height: float = height / rows
+
+    return [
+        set_root_viewport(edited, root, x + column * tile_width, y + row * tile_height, tile_width, tile_height)
+        for row in range(rows)
+        for column in range(columns)
+    ], scale
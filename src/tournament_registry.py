@@ -0,0 +1,148 @@
+from dataclasses import dataclass, asdict
+from typing import Any
+import logging
+
+from state_store import StateStore
+
+# Configure logging
+logger = logging.getLogger(f'{__name__}')
+
+# Keys of the old single-bracket state
+LEGACY_KEYS: tuple[str, ...] = ("bracket_id", "last_channel_id", "is_complete", "last_message_id", "last_update")
+
+@dataclass
+class TrackedTournament:
+    """A single bracket being tracked in one Discord channel."""
+    guild_id: int | None
+    channel_id: int
+    tournament_id: str
+    message_id: int | None = None
+    last_update: str | None = None
+    is_complete: bool = False
+    etag: str | None = None
+    last_modified: str | None = None
+    svg_hash: str | None = None
+
+    @property
+    def key(self) -> str:
+        """Unique key of the tracked bracket (guild:channel:tournament)."""
+        return make_key(self.guild_id, self.channel_id, self.tournament_id)
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "TrackedTournament":
+        return cls(
+            guild_id=data.get("guild_id"),
+            channel_id=data["channel_id"],
+            tournament_id=data["tournament_id"],
+            message_id=data.get("message_id"),
+            last_update=data.get("last_update"),
+            is_complete=data.get("is_complete", False),
+            etag=data.get("etag"),
+            last_modified=data.get("last_modified"),
+            svg_hash=data.get("svg_hash")
+        )
+
+def make_key(guild_id: int | None, channel_id: int, tournament_id: str) -> str:
+    """Build the registry key for a guild/channel/tournament triple."""
+    return f"{guild_id or 0}:{channel_id}:{tournament_id}"
+
+class TournamentRegistry:
+    """All tracked brackets of the bot, persisted item by item in the `tournaments` section of the state store."""
+
+    def __init__(self, store: StateStore):
+        self.store = store
+        self._tournaments: dict[str, TrackedTournament] = {}
+
+        for data in self.store.section("tournaments").values():
+            tracked = TrackedTournament.from_dict(data)
+            self._tournaments[tracked.key] = tracked
+
+        self._migrate_legacy()
+
+    def _migrate_legacy(self) -> None:
+        """Move the old single-bracket keys into the registry"""
+        bracket_id: str | None = self.store.get("bracket_id")
+        channel_id: int | None = self.store.get("last_channel_id")
+
+        if not bracket_id:
+            return
+
+        if channel_id and not self.store.get("is_complete", True):
+            logger.info(f"Migrating legacy bracket {bracket_id} into registry")
+            tracked = TrackedTournament(
+                guild_id=None,
+                channel_id=channel_id,
+                tournament_id=bracket_id,
+                message_id=self.store.get("last_message_id"),
+                last_update=self.store.get("last_update")
+            )
+            self._tournaments[tracked.key] = tracked
+            self.save(tracked)
+
+        for legacy_key in LEGACY_KEYS:
+            self.store.delete(legacy_key)
+
+    def __len__(self) -> int:
+        return len(self._tournaments)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._tournaments
+
+    def get(self, key: str) -> TrackedTournament | None:
+        return self._tournaments.get(key)
+
+    def all(self) -> list[TrackedTournament]:
+        return list(self._tournaments.values())
+
+    def active(self) -> list[TrackedTournament]:
+        """Tracked brackets that are not complete yet."""
+        return [t for t in self._tournaments.values() if not t.is_complete]
+
+    def in_channel(self, channel_id: int) -> list[TrackedTournament]:
+        return [t for t in self._tournaments.values() if t.channel_id == channel_id]
+
+    def in_guild(self, guild_id: int | None) -> list[TrackedTournament]:
+        return [t for t in self._tournaments.values() if t.guild_id == guild_id]
+
+    def track(self, guild_id: int | None, channel_id: int, tournament_id: str) -> TrackedTournament:
+        """Start tracking a bracket, reusing the existing entry (and message) if already tracked."""
+        key: str = make_key(guild_id, channel_id, tournament_id)
+        tracked: TrackedTournament | None = self._tournaments.get(key)
+
+        if tracked:
+            tracked.is_complete = False
+        else:
+            tracked = TrackedTournament(guild_id, channel_id, tournament_id)
+            self._tournaments[key] = tracked
+
+        self.save(tracked)
+        return tracked
+
+    def assign_guild(self, tracked: TrackedTournament, guild_id: int) -> TrackedTournament:
+        """
+        Re-key a bracket tracked without a guild (migrated legacy state) under its guild.
+        Returns the entry kept: the existing one if the bracket was tracked there again since.
+        """
+        self._tournaments.pop(tracked.key, None)
+        self.store.delete_item("tournaments", tracked.key)
+
+        tracked.guild_id = guild_id
+        existing: TrackedTournament | None = self._tournaments.get(tracked.key)
+        if existing:
+            return existing
+
+        self._tournaments[tracked.key] = tracked
+        self.save(tracked)
+        return tracked
+
+    def remove(self, key: str) -> TrackedTournament | None:
+        tracked: TrackedTournament | None = self._tournaments.pop(key, None)
+        self.store.delete_item("tournaments", key)
+        return tracked
+
+    def save(self, tracked: TrackedTournament) -> None:
+        """Persist one tracked bracket"""
+        self.store.set_item("tournaments", tracked.key, tracked.to_dict())
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import socket
+from typing import Any
+
+import pytest
+
+from fake_challonge import FakeServerConfig, serve
+from settings import Settings
+from shard_pool import ShardPool
+from tournament_registry import TrackedTournament
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def refresh_on_shard(settings: Settings, port: int) -> tuple[Any, bool]:
+    server = asyncio.create_task(serve(FakeServerConfig(tournaments=1, seed=1), port=port))
+    await asyncio.sleep(0.5)
+
+    bracket = TrackedTournament(guild_id=1, channel_id=1, tournament_id="soak0")
+    pool = ShardPool(settings, lookup={bracket.key: bracket}.get, on_update=lambda key, update: asyncio.sleep(0))
+    pool.start()
+    try:
+        update = await pool.refresh(bracket)
+        alive: bool = all(worker.process.is_alive() for worker in pool._workers.values())
+    finally:
+        await pool.stop()
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+
+    return update, alive
+
+@pytest.mark.parametrize("render_workers", [0, 1])
+def test_shard_renders_with_and_without_a_pool(tmp_path, monkeypatch, render_workers):
+    monkeypatch.chdir(tmp_path)
+    port: int = free_port()
+    settings = Settings(
+        challonge_api_key="test",
+        challonge_url=f"http://127.0.0.1:{port}/",
+        challonge_api_url=f"http://127.0.0.1:{port}/v1/",
+        status_index_seconds=0,
+        bracket_renderer="native",
+        render_workers=render_workers,
+        shard_workers=1
+    )
+
+    update, alive = asyncio.run(refresh_on_shard(settings, port))
+
+    assert alive
+    assert not update.error
+    assert update.images
+
+def test_result_readers_leave_the_default_executor_free(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # As many workers as the default executor has threads
+    workers: int = min(32, (os.cpu_count() or 1) + 4)
+    settings = Settings(challonge_api_key="test", status_index_seconds=0, shard_workers=workers)
+
+    async def run() -> int:
+        pool = ShardPool(settings, lookup=lambda key: None, on_update=lambda key, update: asyncio.sleep(0))
+        pool.start()
+        try:
+            await asyncio.sleep(1)
+            return await asyncio.wait_for(asyncio.to_thread(lambda: 1), timeout=5)
+        finally:
+            await pool.stop()
+
+    assert asyncio.run(run()) == 1
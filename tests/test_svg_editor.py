@@ -0,0 +1,30 @@
+import math
+
+import pytest
+
+from render_engine import RenderOptions, _prepare
+from svg_generator import generate_svg
+from svg_editor import fit_svg, tile_svg
+
+MAX_PIXELS: int = 4096 * 4096
+
+@pytest.mark.parametrize("tournament_format", ["double_elimination", "round_robin"])
+def test_oversized_bracket_tiles_stay_within_budget(tournament_format):
+    edited, width, height = fit_svg(generate_svg(tournament_format, 1024))
+
+    tiles, scale = tile_svg(edited, 2, MAX_PIXELS, min_scale=1)
+
+    assert 1 < len(tiles) <= 10
+    # Same grid as tile_svg: tiles share the document evenly
+    side: float = math.sqrt(MAX_PIXELS) / scale
+    columns, rows = math.ceil(width / side), math.ceil(height / side)
+    assert columns * rows == len(tiles)
+    assert (width / columns) * (height / rows) * scale * scale <= MAX_PIXELS
+
+def test_oversized_bracket_is_prepared_for_rendering():
+    options = RenderOptions(tile_max_pixels=MAX_PIXELS)
+
+    _, scale, tiles = _prepare(generate_svg("double_elimination", 1024), options)
+
+    assert 1 < len(tiles) <= 10
+    assert 0 < scale < options.min_scale